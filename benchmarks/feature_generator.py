@@ -0,0 +1,96 @@
+import random
+import sys
+
+from behave.model import Feature, Scenario, Step, Table
+from behave.model_core import Status
+
+KEYWORDS = ('Given', 'When', 'Then', 'And')
+
+
+def generate_features(features=10,
+                      scenarios=10,
+                      steps=8,
+                      table_rows=5,
+                      table_columns=4,
+                      text_size=500,
+                      failure_rate=0.05,
+                      undefined_rate=0.02,
+                      skip_rate=0.05,
+                      seed=1):
+    """
+    Build a synthetic tree of behave features with the statuses of an already executed run
+    :param features: the number of features
+    :param scenarios: the number of scenarios per feature
+    :param steps: the number of steps per scenario
+    :param table_rows: the number of rows of the data tables, every fourth step carries a table
+    :param table_columns: the number of columns of the data tables
+    :param text_size: the length of the multiline text, every fifth step carries one
+    :param failure_rate: share of the scenarios with a failing step
+    :param undefined_rate: share of the scenarios with an undefined step
+    :param skip_rate: share of the scenarios tagged with @skip, their steps are all skipped
+    :param seed: seed of the random generator, the same seed always builds the same tree
+    :return: list of behave Feature objects
+    """
+    generator = random.Random(seed)
+    tree = []
+    for feature_index in range(features):
+        filename = f"features/generated_{feature_index}.feature"
+        feature = Feature(filename, 1, 'Feature', f"Generated feature {feature_index}",
+                          tags=['generated'],
+                          description=[f"Synthetic feature number {feature_index}"])
+        for scenario_index in range(scenarios):
+            line = 3 + scenario_index * (steps + 2)
+            roll = generator.random()
+            is_skipped = roll < skip_rate
+            scenario = Scenario(filename, line, 'Scenario', f"Generated scenario {feature_index}.{scenario_index}",
+                                tags=['skip'] if is_skipped else [])
+            scenario.steps = _generate_steps(filename, line, steps, table_rows, table_columns, text_size)
+            if is_skipped:
+                _set_statuses(scenario.steps, Status.skipped)
+            elif roll < skip_rate + failure_rate:
+                _fail_step(scenario.steps, generator.randrange(steps))
+            elif roll < skip_rate + failure_rate + undefined_rate:
+                _set_statuses(scenario.steps, Status.passed)
+                broken = generator.randrange(steps)
+                scenario.steps[broken].status = Status.undefined
+                _set_statuses(scenario.steps[broken + 1:], Status.skipped)
+            else:
+                _set_statuses(scenario.steps, Status.passed)
+            feature.add_scenario(scenario)
+        tree.append(feature)
+    return tree
+
+
+def _generate_steps(filename, line, count, table_rows, table_columns, text_size):
+    steps = []
+    for index in range(count):
+        keyword = KEYWORDS[min(index, len(KEYWORDS) - 1)]
+        table = None
+        text = None
+        if index % 4 == 3:
+            headings = [f"column_{column}" for column in range(table_columns)]
+            table = Table(headings,
+                          rows=[[f"value {row}.{column}" for column in range(table_columns)]
+                                for row in range(table_rows)])
+        elif index % 5 == 4:
+            text = ('Lorem ipsum dolor sit amet ' * (text_size // 27 + 1))[:text_size]
+        steps.append(Step(filename, line + index + 1, keyword, keyword.lower(),
+                          f"the generated step number {index} runs", text=text, table=table))
+    return steps
+
+
+def _set_statuses(steps, status):
+    for step in steps:
+        step.status = status
+
+
+def _fail_step(steps, index):
+    _set_statuses(steps[:index], Status.passed)
+    failed = steps[index]
+    failed.status = Status.failed
+    try:
+        raise AssertionError(f"Generated failure in step {index}")
+    except AssertionError as error:
+        failed.exception = error
+        failed.exc_traceback = sys.exc_info()[2]
+    _set_statuses(steps[index + 1:], Status.skipped)
@@ -0,0 +1,200 @@
+"""
+Drive the BehaveIntegrationService through full launches against a local stub ReportPortal and report
+per-hook latency percentiles, request counts and sizes, throughput and peak memory as JSON.
+
+    python benchmarks/run_benchmarks.py --features 20 --scenarios 20 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tracemalloc
+from collections import Counter, defaultdict
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from behave.model_core import Status  # noqa: E402
+
+from feature_generator import generate_features  # noqa: E402
+from reportportal_behave.behave_integration_service import BehaveIntegrationService  # noqa: E402
+from stub_server import StubReportPortal  # noqa: E402
+from version import __version__  # noqa: E402
+
+MODES = ('scenario', 'step')
+
+
+def run_launch(service, features, latencies, errors):
+    """
+    Call the hooks the way behave does for an execution of the features
+    :param service: the BehaveIntegrationService
+    :param features: the behave features, with their statuses already set
+    :param latencies: dict collecting the duration in seconds of every hook call, by hook name
+    :param errors: Counter collecting the number of hook calls that raised, by hook name
+    :return: the number of hook calls
+    """
+    calls = 0
+
+    def timed(hook, *args, **kwargs):
+        nonlocal calls
+        started = perf_counter()
+        try:
+            return getattr(service, hook)(*args, **kwargs)
+        except Exception:
+            # e.g. an injected error on the launch start or finish, behave would report the hook error and go on
+            errors[hook] += 1
+            return None
+        finally:
+            latencies[hook].append(perf_counter() - started)
+            calls += 1
+
+    launch_id = timed('launch_service', attributes={'benchmark': 'true'}, tags='')
+    for feature in features:
+        feature_id = timed('before_feature', feature)
+        for scenario in feature.scenarios:
+            if 'skip' in scenario.tags:
+                # Excluded with --tags=~@skip, only after_feature reports these
+                continue
+            scenario_id = timed('before_scenario', scenario, feature_id=feature_id)
+            for step in scenario.steps:
+                if step.status in (Status.skipped, Status.undefined):
+                    # behave does not call the step hooks for steps it does not run
+                    continue
+                step_id = timed('before_step', step, scenario_id=scenario_id)
+                timed('after_step', step, step_id)
+            timed('after_scenario', scenario, scenario_id)
+        timed('after_feature', feature, feature_id)
+    timed('after_all', launch_id)
+    return calls
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {}
+
+    def at(fraction):
+        return values[min(len(values) - 1, int(fraction * len(values)))]
+
+    return {
+        'count': len(values),
+        'mean_ms': sum(values) / len(values) * 1000,
+        'p50_ms': at(0.50) * 1000,
+        'p90_ms': at(0.90) * 1000,
+        'p99_ms': at(0.99) * 1000,
+        'max_ms': values[-1] * 1000,
+        'total_ms': sum(values) * 1000,
+    }
+
+
+def run_benchmark(stub, mode, features, service_options, trace_memory):
+    stub.reset()
+    service = BehaveIntegrationService(rp_endpoint=stub.endpoint,
+                                       rp_project='benchmark',
+                                       rp_token='benchmark-token',
+                                       rp_launch_name=f"Benchmark {mode} based",
+                                       rp_launch_description='Synthetic benchmark launch',
+                                       step_based=mode == 'step',
+                                       **service_options)
+    latencies = defaultdict(list)
+    errors = Counter()
+    if trace_memory:
+        tracemalloc.start()
+    started = perf_counter()
+    calls = run_launch(service, features, latencies, errors)
+    elapsed = perf_counter() - started
+    result = {
+        'mode': mode,
+        'wall_time_s': elapsed,
+        'hook_calls': calls,
+        'hook_calls_per_s': calls / elapsed,
+        'requests': stub.total_requests,
+        'requests_by_kind': dict(stub.requests),
+        'requests_per_s': stub.total_requests / elapsed,
+        'bytes_sent': stub.bytes_received,
+        'server_errors': stub.errors,
+        'hook_errors': dict(errors),
+        'hooks': {hook: percentiles(values) for hook, values in latencies.items()},
+        'client_metrics': service.metrics.summary(),
+    }
+    if trace_memory:
+        result['peak_traced_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--features', type=int, default=10)
+    parser.add_argument('--scenarios', type=int, default=10, help='scenarios per feature')
+    parser.add_argument('--steps', type=int, default=8, help='steps per scenario')
+    parser.add_argument('--table-rows', type=int, default=5)
+    parser.add_argument('--text-size', type=int, default=500)
+    parser.add_argument('--failure-rate', type=float, default=0.05)
+    parser.add_argument('--undefined-rate', type=float, default=0.02)
+    parser.add_argument('--skip-rate', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='delay of every stub server answer')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests failing with a 500')
+    parser.add_argument('--async-reporting', action='store_true')
+    parser.add_argument('--log-batch-size', type=int, default=1)
+    parser.add_argument('--reporting-policy', choices=('full', 'failures'), default='full')
+    parser.add_argument('--passed-sample-rate', type=float, default=0.0)
+    parser.add_argument('--backend', choices=('client', 'asyncio'), default='client')
+    parser.add_argument('--backend-concurrency', type=int, default=8)
+    parser.add_argument('--transport-options', type=json.loads,
+                        help='transport_options of the service as a JSON object, e.g. \'{"retries": 3}\'')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='measure the peak Python memory with tracemalloc, slows the hooks down')
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    features = generate_features(features=args.features,
+                                 scenarios=args.scenarios,
+                                 steps=args.steps,
+                                 table_rows=args.table_rows,
+                                 text_size=args.text_size,
+                                 failure_rate=args.failure_rate,
+                                 undefined_rate=args.undefined_rate,
+                                 skip_rate=args.skip_rate,
+                                 seed=args.seed)
+    service_options = {'async_reporting': args.async_reporting,
+                       'log_batch_size': args.log_batch_size,
+                       'reporting_policy': args.reporting_policy,
+                       'passed_sample_rate': args.passed_sample_rate,
+                       'backend': args.backend,
+                       'backend_concurrency': args.backend_concurrency,
+                       'transport_options': args.transport_options}
+    with StubReportPortal(latency=args.latency_ms / 1000, error_rate=args.error_rate, seed=args.seed) as stub:
+        results = [run_benchmark(stub, mode, features, service_options, args.trace_memory) for mode in args.modes]
+
+    report = {
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': vars(args),
+        'peak_rss_bytes': peak_rss_bytes(),
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubReportPortal:
+    """
+    Minimal stand-in for the ReportPortal API used by the client.
+    It answers every launch, item and log request with a fresh id, records the number and size of the requests
+    and can delay the answers or fail a share of them.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=None):
+        """
+        :param latency: seconds to wait before answering a request
+        :param error_rate: share of the requests answered with a 500 error, between 0 and 1
+        :param seed: seed of the random generator deciding which requests fail
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = Counter()
+        self.bytes_received = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    @property
+    def total_requests(self):
+        return sum(self.requests.values())
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self.bytes_received = 0
+            self.errors = 0
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _record(self, kind, size):
+        with self._lock:
+            self.requests[kind] += 1
+            self.bytes_received += size
+            fail = self.error_rate and self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            return fail
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                self._answer()
+
+            def do_PUT(self):
+                self._answer()
+
+            def do_GET(self):
+                self._answer()
+
+            def _answer(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                self.rfile.read(length)
+                kind = _request_kind(self.command, self.path)
+                size = length + sum(len(key) + len(value) + 4 for key, value in self.headers.items())
+                fail = stub._record(kind, size)
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if fail:
+                    self._send(500, {'errorCode': 5000, 'message': 'Injected error'})
+                elif kind == 'log' and self.headers.get('Content-Type', '').startswith('multipart/'):
+                    self._send(201, {'responses': [{'id': str(uuid.uuid4())}]})
+                elif self.command == 'POST':
+                    self._send(201, {'id': str(uuid.uuid4())})
+                else:
+                    self._send(200, {'message': 'OK', 'id': 1})
+
+            def _send(self, status, body):
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _request_kind(method, path):
+    parts = path.split('?')[0].strip('/').split('/')
+    # /api/<version>/<project>/<resource>/...
+    resource = parts[3] if len(parts) > 3 else ''
+    if resource == 'launch':
+        return 'finish_launch' if parts[-1] == 'finish' else f"{method.lower()}_launch"
+    if resource == 'item':
+        return 'start_item' if method == 'POST' else 'finish_item'
+    return resource or 'other'
@@ -0,0 +1,322 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import sys
+import threading
+from collections import deque
+
+from reportportal_behave.journal import EventJournal, SpoolingIntegrationService
+from reportportal_behave.replay import JournalReplayer
+from reportportal_behave.reportportal_service import IntegrationService, TRANSPORT_BACKENDS
+
+logger = logging.getLogger(__name__)
+
+AGENT_SOCKET_ENV = 'RP_AGENT_SOCKET'
+
+_LAUNCH_METHODS = ('start_launcher', 'rerun_launcher')
+_CONNECTION_CLOSED = 'connection_closed'
+_SYNC = 'sync'
+
+
+class AgentIntegrationService(SpoolingIntegrationService):
+    """
+    Stands in for the IntegrationService and streams every call to a reporting agent over a Unix domain socket.
+    The events use the journal format and attachments are written next to the socket for the agent to pick up, so
+    nothing waits for ReportPortal and the behave process can exit as soon as its events are written.
+    """
+
+    id_prefix = 'agent'
+
+    def __init__(self, socket_path, buffer_size=64 * 1024):
+        """
+        :param socket_path: the path of the socket the agent listens on
+        :param buffer_size: the number of bytes buffered before they are sent to the agent
+        """
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(socket_path)
+        self.journal = EventJournal(socket_path,
+                                    stream=self.socket.makefile('w', buffering=buffer_size, encoding='utf-8'))
+
+    def start_launcher(self, **kwargs):
+        # Other workers may join the launch with the returned id, the agent has to know it first
+        launch_id = super().start_launcher(**kwargs)
+        self.journal.flush()
+        return launch_id
+
+    def rerun_launcher(self, **kwargs):
+        launch_id = super().rerun_launcher(**kwargs)
+        self.journal.flush()
+        return launch_id
+
+    def drain(self):
+        """
+        Send the buffered events and wait for the agent to queue them, so that they are sent before the events
+        another process writes from now on, e.g. the finish of a shared launch
+        :return: None
+        """
+        self.journal.append(_SYNC, {})
+        self.journal.flush()
+        self.socket.recv(1)
+
+    def terminate_service(self):
+        self.journal.close()
+        self.socket.close()
+
+
+class ReportingAgent:
+    """
+    Long-lived process sending the events of many behave invocations to ReportPortal over warm pooled connections.
+    Every connection is read by its own thread into a shared queue. The events are then sent in order with the
+    JournalReplayer, through one IntegrationService per launch sharing a single HTTP session, and the logs of all
+    the connections are batched together.
+    """
+
+    def __init__(self, service_factory, socket_path, workers=8, log_batch_size=20, flush_interval=1,
+                 max_queue_size=10000, join_timeout=10):
+        """
+        :param service_factory: callable returning a new IntegrationService, called for every launch
+        :param socket_path: the path of the Unix domain socket to listen on
+        :param workers: the number of log batches uploaded at the same time
+        :param log_batch_size: the maximum number of logs in a batch
+        :param flush_interval: the seconds without events after which the collected logs are sent
+        :param max_queue_size: the maximum number of events received but not sent; past it the connections wait
+        :param join_timeout: the seconds a worker joining a launch waits for the launch to be started
+        """
+        self.socket_path = socket_path
+        self.flush_interval = flush_interval
+        self.join_timeout = join_timeout
+        self.replayer = _AgentReplayer(service_factory, workers=workers, log_batch_size=log_batch_size)
+        self._events = queue.Queue(maxsize=max_queue_size)
+        self._connections = itertools.count()
+        self._readers = set()
+        self._launches = set()
+        self._launches_condition = threading.Condition()
+        self._stopping = threading.Event()
+        self._server = None
+
+    def serve(self):
+        """
+        Accept connections until stop is called, then send the events received so far
+        :return: None
+        """
+        if os.path.exists(self.socket_path):
+            # Left over by an agent that did not shut down cleanly
+            os.remove(self.socket_path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.socket_path)
+        self._server.listen(128)
+        # Closing the socket does not interrupt a blocking accept, stop is checked between the timeouts instead
+        self._server.settimeout(self.flush_interval)
+        sender = threading.Thread(target=self.replayer.send_events, args=(self._iter_events(),), name='rp-agent-sender')
+        sender.start()
+        logger.info("Reporting agent listening on %s", self.socket_path)
+        try:
+            while not self._stopping.is_set():
+                try:
+                    connection, _ = self._server.accept()
+                except socket.timeout:
+                    continue
+                except OSError:
+                    # The server socket was closed by stop
+                    break
+                connection.setblocking(True)
+                reader = threading.Thread(target=self._read, args=(connection, next(self._connections)),
+                                          name='rp-agent-connection', daemon=True)
+                self._readers.add(reader)
+                reader.start()
+        finally:
+            self._stopping.set()
+            for reader in list(self._readers):
+                reader.join(timeout=self.join_timeout)
+            self._events.put(None)
+            sender.join()
+            self.replayer.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            logger.info("Reporting agent stopped after sending %s events", self.replayer.sent_events)
+
+    def stop(self, *args):
+        self._stopping.set()
+        if self._server is not None:
+            self._server.close()
+
+    def _read(self, connection, connection_id):
+        try:
+            with connection, connection.makefile('r', encoding='utf-8') as events:
+                for line in events:
+                    if not line.endswith('\n'):
+                        logger.warning("Ignoring incomplete event of connection %s", connection_id)
+                        break
+                    event = json.loads(line)
+                    if event['m'] == _SYNC:
+                        # Everything read before was queued
+                        connection.sendall(b'\n')
+                        continue
+                    event['c'] = connection_id
+                    if event['m'] == 'join_launcher':
+                        self._wait_for_launch(event['kw'].get('launch_id'))
+                    self._events.put(event)
+                    if event['m'] in _LAUNCH_METHODS:
+                        with self._launches_condition:
+                            self._launches.add(event['id'])
+                            self._launches_condition.notify_all()
+        except (OSError, ValueError):
+            logger.exception("Connection %s failed", connection_id)
+        finally:
+            self._events.put({'m': _CONNECTION_CLOSED, 'c': connection_id})
+            self._readers.discard(threading.current_thread())
+
+    def _wait_for_launch(self, launch_id):
+        """
+        A launch started through the agent may be joined by another connection as soon as its id was handed out,
+        the start has to be queued first
+        """
+        if not (launch_id or '').startswith(f"{AgentIntegrationService.id_prefix}-"):
+            return
+        with self._launches_condition:
+            if not self._launches_condition.wait_for(lambda: launch_id in self._launches, self.join_timeout):
+                logger.warning("Launch %s to join is unknown to the agent", launch_id)
+
+    def _iter_events(self):
+        while True:
+            try:
+                event = self._events.get(timeout=self.flush_interval)
+            except queue.Empty:
+                # Nothing arrived for a while, send the logs collected so far
+                yield None
+                continue
+            if event is None:
+                return
+            yield event, None
+
+
+class _AgentReplayer(JournalReplayer):
+    """
+    JournalReplayer sending the events of every launch with its own IntegrationService. Events that fail are skipped
+    instead of stopping the agent, attachments are removed once sent and the ids of a connection are forgotten once
+    all its events were sent.
+    """
+
+    def __init__(self, service_factory, workers, log_batch_size):
+        super().__init__(None, ack_path=None, workers=workers, log_batch_size=log_batch_size, stop_on_error=False)
+        self.service_factory = service_factory
+        self._services = {}
+        self._connection_launches = {}
+        self._connection_ids = {}
+        self._finished_launches = set()
+        self._closed_connections = deque()
+
+    def close(self):
+        for service in self._services.values():
+            service.terminate_service()
+        self._services.clear()
+
+    def _send(self, index, event):
+        self._forget_closed_connections()
+        connection_id = event['c']
+        if event['m'] == _CONNECTION_CLOSED:
+            self._closed_connections.append((index, connection_id))
+            self._acknowledge([index])
+            return
+        if event['m'] in _LAUNCH_METHODS:
+            self._connection_launches[connection_id] = event['id']
+            self._services[event['id']] = self.service_factory()
+        elif event['m'] == 'join_launcher':
+            launch = event['kw']['launch_id']
+            self._connection_launches[connection_id] = launch
+            if launch not in self._services:
+                # A launch started outside the agent
+                self._services[launch] = self.service_factory()
+        elif event['m'] == 'finish_launcher':
+            self._finished_launches.add(self._connection_launches.get(connection_id))
+        super()._send(index, event)
+        if 'id' in event and event['m'] not in _LAUNCH_METHODS:
+            self._connection_ids.setdefault(connection_id, []).append(event['id'])
+
+    def _send_logs(self, logs):
+        unknown = [index for index, event in logs if self._connection_launches.get(event['c']) not in self._services]
+        if unknown:
+            # A connection logging outside of a launch must not make the logs of the others fail with it
+            logger.warning("Skipping %s logs sent before starting or joining a launch", len(unknown))
+            self._acknowledge(unknown)
+        try:
+            super()._send_logs([(index, event) for index, event in logs if index not in unknown])
+        finally:
+            for index, event in logs:
+                attachment = event['kw'].get('attachment')
+                if attachment and os.path.exists(attachment['path']):
+                    os.remove(attachment['path'])
+
+    def _service(self, event):
+        launch = self._connection_launches.get(event['c'])
+        if launch not in self._services:
+            raise ValueError(f"Connection {event['c']} sent {event['m']} before starting or joining a launch")
+        return self._services[launch]
+
+    def _forget_closed_connections(self):
+        """
+        Drop the ids and the finished launches of the closed connections once every event before the close was sent
+        """
+        with self._lock:
+            oldest = next(iter(self._in_flight), None)
+        while self._closed_connections and (oldest is None or self._closed_connections[0][0] < oldest):
+            index, connection_id = self._closed_connections.popleft()
+            for item_id in self._connection_ids.pop(connection_id, ()):
+                self._item_ids.pop(item_id, None)
+            launch = self._connection_launches.pop(connection_id, None)
+            if launch in self._finished_launches and launch not in self._connection_launches.values():
+                self._finished_launches.discard(launch)
+                self._item_ids.pop(launch, None)
+                self._services.pop(launch).terminate_service()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a local agent sending the results of behave runs to ReportPortal')
+    parser.add_argument('--socket', default=os.environ.get(AGENT_SOCKET_ENV, '/tmp/rp-behave-agent.sock'),
+                        help='path of the Unix domain socket to listen on')
+    parser.add_argument('--endpoint', default=os.environ.get('RP_ENDPOINT'), help='ReportPortal URL')
+    parser.add_argument('--project', default=os.environ.get('RP_PROJECT'), help='ReportPortal project')
+    parser.add_argument('--token', default=os.environ.get('RP_TOKEN'), help='ReportPortal token')
+    parser.add_argument('--verify-ssl', action='store_true', help='verify the SSL certificate of ReportPortal')
+    parser.add_argument('--workers', type=int, default=8, help='number of concurrent log uploads')
+    parser.add_argument('--log-batch-size', type=int, default=20, help='maximum number of logs per request')
+    parser.add_argument('--flush-interval', type=float, default=1, help='seconds a log waits for its batch to fill up')
+    parser.add_argument('--backend', choices=TRANSPORT_BACKENDS, default='client',
+                        help='transport backend sending the requests')
+    args = parser.parse_args(argv)
+    if not (args.endpoint and args.project and args.token):
+        parser.error('--endpoint, --project and --token (or RP_ENDPOINT, RP_PROJECT and RP_TOKEN) are required')
+    logging.basicConfig(level=logging.INFO)
+
+    def create_service(session=None):
+        return IntegrationService(rp_endpoint=args.endpoint,
+                                  rp_project=args.project,
+                                  rp_token=args.token,
+                                  rp_launch_name=None,
+                                  rp_launch_description=None,
+                                  verify_ssl=args.verify_ssl,
+                                  transport_options={'pool_size': args.workers, 'max_concurrency': args.workers},
+                                  backend=args.backend,
+                                  backend_concurrency=args.workers,
+                                  session=session)
+
+    # The connections to ReportPortal are opened once and shared by the services of all the launches
+    session = create_service().backend.session
+    agent = ReportingAgent(lambda: create_service(session),
+                           socket_path=args.socket,
+                           workers=args.workers,
+                           log_batch_size=args.log_batch_size,
+                           flush_interval=args.flush_interval)
+    signal.signal(signal.SIGTERM, agent.stop)
+    signal.signal(signal.SIGINT, agent.stop)
+    agent.serve()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
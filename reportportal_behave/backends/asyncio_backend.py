@@ -0,0 +1,218 @@
+import asyncio
+import functools
+import logging
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from reportportal_behave.backends.client_backend import ClientBackend
+from reportportal_behave.reportportal_service import reportportal_error_handler
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncioBackend(ClientBackend):
+    """
+    Transport backend keeping several requests in flight.
+    Calls are scheduled on an event loop running in its own thread and return right away; item starts return a
+    placeholder id backed by a future. A request waits for the items it refers to be created, and an item is only
+    finished once every request on it and its descendants completed, so ReportPortal sees parents before children.
+    The requests themselves go through the session of the client, at most max_concurrency at a time.
+    """
+
+    concurrent = True
+
+    def __init__(self, endpoint, project, token, verify_ssl=False, session=None, max_concurrency=8, metrics=None):
+        """
+        :param session: a requests session to share with other backends, with the same token
+        :param max_concurrency: the maximum number of requests in flight
+        :param metrics: the ClientMetrics recording the duration of the requests, the errors and the number of
+                        requests in flight
+        """
+        super().__init__(endpoint=endpoint, project=project, token=token, verify_ssl=verify_ssl, session=session)
+        self.max_concurrency = max_concurrency
+        self.metrics = metrics
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='rp-asyncio-request')
+        # Only touched from the loop thread
+        self._item_ids = {}
+        self._parents = {}
+        self._pending = {}
+        self._tasks = set()
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = None
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, args=(ready,), name='rp-asyncio-backend', daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def start_launch(self, name, start_time, description=None, attributes=None):
+        return self._wait(self._send('start_launch', super().start_launch,
+                                     name=name, start_time=start_time, description=description, attributes=attributes))
+
+    def rerun_launch(self, launch_id, name, start_time, description=None, attributes=None):
+        return self._wait(self._send('start_launch', super().rerun_launch, launch_id=launch_id,
+                                     name=name, start_time=start_time, description=description, attributes=attributes))
+
+    def finish_launch(self, end_time, status=None, attributes=None):
+        return self._wait(self._finish_launch(end_time, status, attributes))
+
+    def start_item(self, name, start_time, item_type, description=None, attributes=None, parent_item_id=None,
+                   retry=False):
+        placeholder = f"async-{uuid.uuid4()}"
+        kwargs = {'name': name, 'start_time': start_time, 'item_type': item_type, 'description': description,
+                  'attributes': attributes, 'retry': retry}
+        self._loop.call_soon_threadsafe(self._schedule_start, placeholder, parent_item_id, kwargs)
+        return placeholder
+
+    def finish_item(self, end_time, status, item_id, issue=None, attributes=None):
+        kwargs = {'end_time': end_time, 'status': status, 'issue': issue, 'attributes': attributes}
+        self._loop.call_soon_threadsafe(self._schedule_finish, item_id, kwargs)
+
+    def log(self, time, message, level='INFO', attachment=None, item_id=None):
+        # The caller closes the attachment once this returns, so its content is read now
+        kwargs = {'time': time, 'message': message, 'level': level, 'attachment': _read_attachment(attachment)}
+        self._loop.call_soon_threadsafe(self._schedule, self._log, (item_id,), item_id, kwargs)
+
+    def log_batch(self, entries):
+        entries = [dict(entry, attachment=_read_attachment(entry['attachment'])) if entry.get('attachment') else entry
+                   for entry in entries]
+        item_ids = tuple({entry['itemUuid'] for entry in entries if entry.get('itemUuid')})
+        self._loop.call_soon_threadsafe(self._schedule, self._log_batch, item_ids, entries)
+
+    def drain(self):
+        self._wait(self._drain())
+
+    def resolve_id(self, item_id):
+        return self._wait(self._resolve(item_id))
+
+    def terminate(self):
+        self._wait(self._drain())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._executor.shutdown()
+        super().terminate()
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        ready.set()
+        self._loop.run_forever()
+
+    def _wait(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def _schedule_start(self, placeholder, parent_item_id, kwargs):
+        self._item_ids[placeholder] = self._loop.create_future()
+        self._pending[placeholder] = set()
+        self._parents[placeholder] = parent_item_id
+        self._spawn(self._start_item(placeholder, parent_item_id, kwargs), (parent_item_id,))
+
+    def _schedule_finish(self, item_id, kwargs):
+        # The finish is tracked by the ancestors of the item, it waits for the requests on the item itself
+        self._spawn(self._finish_item(item_id, kwargs), (self._parents.get(item_id),))
+
+    def _schedule(self, method, item_ids, *args):
+        self._spawn(method(*args), item_ids)
+
+    def _spawn(self, coroutine, item_ids):
+        task = self._loop.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        for item_id in item_ids:
+            # Register the request with the item and its ancestors so none of them is finished before it
+            while item_id in self._pending:
+                self._pending[item_id].add(task)
+                task.add_done_callback(self._pending[item_id].discard)
+                item_id = self._parents.get(item_id)
+        if self.metrics is not None:
+            self.metrics.gauge('asyncio_backend.in_flight', len(self._tasks))
+
+    async def _resolve(self, item_id):
+        if item_id in self._item_ids:
+            return await self._item_ids[item_id]
+        return item_id
+
+    async def _send(self, call_type, method, **kwargs):
+        async with self._semaphore:
+            if self.metrics is None:
+                return await self._loop.run_in_executor(self._executor, functools.partial(method, **kwargs))
+            started = perf_counter()
+            try:
+                return await self._loop.run_in_executor(self._executor, functools.partial(method, **kwargs))
+            finally:
+                self.metrics.record(f"rp.{call_type}", perf_counter() - started)
+
+    async def _start_item(self, placeholder, parent_item_id, kwargs):
+        item_id = None
+        try:
+            parent = await self._resolve(parent_item_id)
+            if parent_item_id and parent is None:
+                logger.warning("Skipping %s because its parent item could not be created", kwargs['name'])
+            else:
+                item_id = await self._send('start_item', super().start_item, parent_item_id=parent, **kwargs)
+        except Exception:
+            self._report_error()
+        finally:
+            self._item_ids[placeholder].set_result(item_id)
+
+    async def _finish_item(self, item_id, kwargs):
+        try:
+            pending = self._pending.pop(item_id, None)
+            if pending:
+                await asyncio.wait(pending)
+            self._parents.pop(item_id, None)
+            resolved = await self._resolve(item_id)
+            if resolved is not None:
+                await self._send('finish_item', super().finish_item, item_id=resolved, **kwargs)
+        except Exception:
+            self._report_error()
+
+    async def _log(self, item_id, kwargs):
+        try:
+            resolved = await self._resolve(item_id)
+            if item_id and resolved is None:
+                return
+            await self._send('attachment' if kwargs['attachment'] else 'log', super().log, item_id=resolved, **kwargs)
+        except Exception:
+            self._report_error()
+
+    async def _log_batch(self, entries):
+        try:
+            resolved_entries = []
+            for entry in entries:
+                if entry.get('itemUuid'):
+                    entry = dict(entry, itemUuid=await self._resolve(entry['itemUuid']))
+                    if entry['itemUuid'] is None:
+                        continue
+                resolved_entries.append(entry)
+            if resolved_entries:
+                await self._send('log_batch', super().log_batch, entries=resolved_entries)
+        except Exception:
+            self._report_error()
+
+    async def _finish_launch(self, end_time, status, attributes):
+        await self._drain()
+        return await self._send('finish_launch', super().finish_launch,
+                               end_time=end_time, status=status, attributes=attributes)
+
+    async def _drain(self):
+        while self._tasks:
+            await asyncio.wait(set(self._tasks))
+
+    def _report_error(self):
+        if self.metrics is not None:
+            # The request failed after the service call returned, so the service could not count it
+            self.metrics.increment('errors')
+        reportportal_error_handler(sys.exc_info(), self.metrics)
+
+
+def _read_attachment(attachment):
+    if not attachment or not hasattr(attachment.get('data'), 'read'):
+        return attachment
+    data = attachment['data']
+    if hasattr(data, 'seek'):
+        data.seek(0)
+    return dict(attachment, data=data.read())
@@ -0,0 +1,151 @@
+import json
+import uuid
+
+from reportportal_client import ReportPortalService
+from reportportal_client.service import _dict_to_payload, _get_data, _get_id, _get_msg, uri_join
+
+
+class ClientBackend:
+    """
+    Transport backend sending every request synchronously with the ReportPortal client.
+    This is the default backend and defines the interface the other backends implement: starting, rerunning, joining
+    and finishing the launch, starting and finishing items, logging, resolving item ids and terminating.
+    """
+
+    # Whether the calls return before the request was sent, so callers do not need threads to send in parallel
+    concurrent = False
+
+    def __init__(self, endpoint, project, token, verify_ssl=False, session=None):
+        """
+        :param session: a requests session to share with other backends, with the same token
+        """
+        self.client = ReportPortalService(endpoint=endpoint,
+                                          project=project,
+                                          token=token,
+                                          verify_ssl=verify_ssl)
+        if session is not None:
+            self.client.session = session
+
+    @property
+    def session(self):
+        return self.client.session
+
+    @property
+    def launch_id(self):
+        return self.client.launch_id
+
+    def start_launch(self, name, start_time, description=None, attributes=None):
+        return self.client.start_launch(name=name,
+                                        start_time=start_time,
+                                        description=description,
+                                        attributes=attributes)
+
+    def rerun_launch(self, launch_id, name, start_time, description=None, attributes=None):
+        # The client has no support for reruns, so the request is sent directly
+        data = {
+            'name': name,
+            'description': description,
+            'attributes': _dict_to_payload(dict(attributes)) if attributes else None,
+            'startTime': start_time,
+            'rerun': True,
+            'rerunOf': launch_id
+        }
+        url = uri_join(self.client.base_url_v2, 'launch')
+        response = self.client.session.post(url=url, json=data, verify=self.client.verify_ssl)
+        self.client.launch_id = _get_id(response)
+        return self.client.launch_id
+
+    def join_launch(self, launch_id):
+        self.client.launch_id = launch_id
+
+    def finish_launch(self, end_time, status=None, attributes=None):
+        if not attributes:
+            return self.client.finish_launch(end_time=end_time, status=status)
+        # The client leaves the attributes out of the finish request, so it is sent directly
+        data = {
+            'endTime': end_time,
+            'status': status,
+            'attributes': _dict_to_payload(dict(attributes))
+        }
+        url = uri_join(self.client.base_url_v1, 'launch', self.client.launch_id, 'finish')
+        response = self.client.session.put(url=url, json=data, verify=self.client.verify_ssl)
+        return _get_msg(response)
+
+    def start_item(self, name, start_time, item_type, description=None, attributes=None, parent_item_id=None,
+                   retry=False):
+        if not retry:
+            return self.client.start_test_item(name=name,
+                                               description=description,
+                                               attributes=attributes,
+                                               start_time=start_time,
+                                               item_type=item_type,
+                                               parent_item_id=parent_item_id)
+        # The client has no support for retries, so the request is sent directly
+        data = {
+            'name': name,
+            'description': description,
+            'attributes': _dict_to_payload(dict(attributes)) if attributes else None,
+            'startTime': start_time,
+            'launchUuid': self.client.launch_id,
+            'type': item_type,
+            'hasStats': True,
+            'retry': True
+        }
+        url = uri_join(self.client.base_url_v2, 'item', parent_item_id)
+        response = self.client.session.post(url=url, json=data, verify=self.client.verify_ssl)
+        return _get_id(response)
+
+    def finish_item(self, end_time, status, item_id, issue=None, attributes=None):
+        return self.client.finish_test_item(end_time=end_time,
+                                            status=status,
+                                            issue=issue,
+                                            attributes=attributes,
+                                            item_id=item_id)
+
+    def log(self, time, message, level='INFO', attachment=None, item_id=None):
+        if not attachment:
+            return self.client.log(time=time,
+                                   message=message,
+                                   level=level,
+                                   item_id=item_id)
+        entry = {'time': time, 'message': message, 'level': level, 'attachment': attachment}
+        if item_id:
+            entry['itemUuid'] = item_id
+        return self.log_batch([entry])
+
+    def log_batch(self, entries):
+        """
+        :param entries: list of dicts with the time, message, level, itemUuid and attachment of every log
+        """
+        # The multipart request of the client relies on collections.Mapping, removed in Python 3.10, so it is built here
+        logs = []
+        files = []
+        for entry in entries:
+            log = dict(entry, launchUuid=self.client.launch_id)
+            attachment = log.pop('attachment', None)
+            if attachment:
+                name = attachment.get('name') or str(uuid.uuid4())
+                log['file'] = {'name': name}
+                files.append(('file', (name, attachment['data'], attachment.get('mime') or 'application/octet-stream')))
+            logs.append(log)
+        files.insert(0, ('json_request_part', (None, json.dumps(logs), 'application/json')))
+        url = uri_join(self.client.base_url_v2, 'log')
+        response = self.client.session.post(url=url, files=files, verify=self.client.verify_ssl)
+        return _get_data(response)
+
+    def drain(self):
+        """
+        Block until every request was sent, they are all sent synchronously
+        :return: None
+        """
+        return None
+
+    def resolve_id(self, item_id):
+        """
+        :param item_id: an id returned by start_item
+        :return: the id of the item in ReportPortal
+        """
+        return item_id
+
+    def terminate(self):
+        self.client.terminate()
@@ -1,10 +1,20 @@
+import itertools
+import os
+import sys
 import traceback
 
-from mss import mss
-
+from reportportal_behave.agent import AgentIntegrationService
 from reportportal_behave.entities.feature import Feature
 from reportportal_behave.entities.scenario import Scenario
 from reportportal_behave.entities.step import Step
+from reportportal_behave.journal import SpoolingIntegrationService
+from reportportal_behave.launch_coordinator import SHARED_LAUNCH_ID_ENV, SharedLaunchCoordinator
+from reportportal_behave.metrics import ClientMetrics, timed_hook
+from reportportal_behave.payload import PayloadPolicy
+from reportportal_behave.profiler import RunProfiler, profiled_hook
+from reportportal_behave.reporting_policy import REPORTING_POLICIES, ScenarioStepBuffer
+from reportportal_behave.reporting_queue import QueuedIntegrationService
+from reportportal_behave.rerun_index import RerunIndex
 from reportportal_behave.reportportal_service import *
 
 
@@ -19,7 +29,38 @@ class BehaveIntegrationService:
                  rp_enable=True,
                  step_based=False,
                  add_screenshot=False,
-                 verify_ssl=False):
+                 verify_ssl=False,
+                 async_reporting=False,
+                 max_queue_size=1000,
+                 backpressure='block',
+                 log_batch_size=1,
+                 log_batch_payload_size=10 * 1024 * 1024,
+                 log_flush_interval=5,
+                 screenshot_max_size=5 * 1024 * 1024,
+                 screenshot_max_width=None,
+                 screenshot_monitor=1,
+                 shared_launch=False,
+                 shared_launch_dir=None,
+                 shared_launch_workers=None,
+                 shared_launch_ttl=24 * 60 * 60,
+                 spool_path=None,
+                 agent_socket=None,
+                 transport_options=None,
+                 metrics_file=None,
+                 metrics_attributes=False,
+                 max_log_message_size=64 * 1024,
+                 log_preview_size=4 * 1024,
+                 attach_oversized_logs=True,
+                 reporting_policy='full',
+                 passed_sample_rate=0.0,
+                 rerun_index_path=None,
+                 rerun=False,
+                 rerun_launch_id=None,
+                 backend='client',
+                 backend_concurrency=8,
+                 profile_steps=False,
+                 profile_top=10,
+                 profile_attributes=False):
         self.rp_endpoint = rp_endpoint
         self.rp_project = rp_project
         self.rp_token = rp_token
@@ -28,42 +69,129 @@ class BehaveIntegrationService:
         self.rp_enable = rp_enable
         self.step_based = step_based
         self.add_screenshot = add_screenshot
-        self.service = IntegrationService(rp_endpoint=rp_endpoint,
-                                          rp_project=rp_project,
-                                          rp_token=rp_token,
-                                          rp_launch_name=rp_launch_name,
-                                          rp_launch_description=rp_launch_description,
-                                          verify_ssl=verify_ssl)
+        self.metrics_file = metrics_file
+        self.metrics_attributes = metrics_attributes
+        if reporting_policy not in REPORTING_POLICIES:
+            raise ValueError(f"reporting_policy must be one of {REPORTING_POLICIES}, got {reporting_policy!r}")
+        self.reporting_policy = reporting_policy
+        if rerun_index_path and spool_path:
+            raise ValueError("rerun_index_path cannot be combined with spool_path, the journal has no item ids yet")
+        if rerun_index_path and agent_socket:
+            raise ValueError("rerun_index_path cannot be combined with agent_socket, the agent keeps the item ids")
+        if shared_launch and not shared_launch_workers and not os.environ.get(SHARED_LAUNCH_ID_ENV):
+            # Otherwise a worker finishing before a slower one joins closes the launch and the late one starts another
+            raise ValueError(f"shared_launch requires shared_launch_workers, or a launch id in {SHARED_LAUNCH_ID_ENV}")
+        self.rerun = rerun
+        self.rerun_launch_id = rerun_launch_id
+        self.rerun_index = None
+        self._rerun_features = set()
+        self.profile_attributes = profile_attributes
+        self.metrics = None
+        self.profiler = None
+        self.step_buffer = None
+        self.payload_policy = PayloadPolicy(max_message_size=max_log_message_size,
+                                            preview_size=log_preview_size,
+                                            attach_oversized=attach_oversized_logs)
+        self.screenshots = None
+        self.launch_coordinator = None
+        if not rp_enable:
+            # Nothing is reported, so neither the ReportPortal client nor mss get imported
+            self.service = NullIntegrationService()
+            return
+        self.metrics = ClientMetrics()
+        if profile_steps:
+            # Durations of the features, scenarios and steps, reported with the launch in after_all
+            self.profiler = RunProfiler(top=profile_top)
+        if rerun_index_path:
+            # Maps the features and scenarios to their items, so a rerun only reports the retried scenarios
+            self.rerun_index = RerunIndex(rerun_index_path)
+        if reporting_policy == 'failures':
+            # Steps are kept locally and only uploaded in full for the scenarios that fail or get sampled
+            self.step_buffer = ScenarioStepBuffer(passed_sample_rate=passed_sample_rate)
+        if add_screenshot:
+            from reportportal_behave.screenshot import ScreenshotService
+            self.screenshots = ScreenshotService(max_size=screenshot_max_size,
+                                                 max_width=screenshot_max_width,
+                                                 monitor=screenshot_monitor,
+                                                 metrics=self.metrics)
+        if spool_path:
+            # Everything is written to a local journal and sent to ReportPortal later with rp-behave-replay
+            self.service = SpoolingIntegrationService(spool_path)
+        elif agent_socket:
+            # Everything is streamed to a local rp-behave-agent, which sends it to ReportPortal
+            self.service = AgentIntegrationService(agent_socket)
+        else:
+            self.service = IntegrationService(rp_endpoint=rp_endpoint,
+                                              rp_project=rp_project,
+                                              rp_token=rp_token,
+                                              rp_launch_name=rp_launch_name,
+                                              rp_launch_description=rp_launch_description,
+                                              verify_ssl=verify_ssl,
+                                              log_batch_size=log_batch_size,
+                                              log_batch_payload_size=log_batch_payload_size,
+                                              log_flush_interval=log_flush_interval,
+                                              transport_options=transport_options,
+                                              metrics=self.metrics,
+                                              backend=backend,
+                                              backend_concurrency=backend_concurrency)
+        if async_reporting:
+            # Hooks only enqueue the events and return placeholder ids, a background worker does the sending
+            self.service = QueuedIntegrationService(self.service,
+                                                    max_queue_size=max_queue_size,
+                                                    backpressure=backpressure,
+                                                    metrics=self.metrics)
+        if shared_launch:
+            self.launch_coordinator = SharedLaunchCoordinator(self.service,
+                                                              launch_name=rp_launch_name,
+                                                              rendezvous_dir=shared_launch_dir,
+                                                              workers=shared_launch_workers,
+                                                              state_ttl=shared_launch_ttl)
 
-    def log_step_error_result(self, step_name, item_id, error_msg=None):
+    def log_step_error_result(self, step_name, item_id, error_msg=None, screenshot=False, end_time=None,
+                              screenshots=None):
         """
         Log errors in steps if it happens
         :param step_name: the name of the step
         :param item_id: the id of the step execution
-        :param error_msg: the error message
+        :param error_msg: the error message, a string or an iterable of string chunks
+        :param screenshot: attach a screenshot to the error if add_screenshot is enabled
+        :param end_time: the time of the error, now if not set
+        :param screenshots: screenshot attachments captured earlier; if not set the screenshot is taken now
         :return: None
         """
-        if self.add_screenshot:
-            with mss() as sct:
-                screenshot_name = sct.shot()
+        end_time = end_time or timestamp()
+        message, full_error = None, None
+        if error_msg is not None:
+            message, full_error = self.payload_policy.render(f"{step_name} error", error_msg)
+        if screenshot and self.add_screenshot:
+            if full_error:
+                # A log holds a single attachment, the full error gets its own log next to the screenshot
+                self.service.log_step_result(end_time=end_time,
+                                             message=message,
+                                             level='ERROR',
+                                             attachment=full_error,
+                                             item_id=item_id)
 
-            # Logs assertion message with attachment and ERROR level it step was failed.
-            self.service.log_step_result(end_time=timestamp(),
-                                         message=error_msg,
-                                         level='ERROR',
-                                         attachment={
-                                             'name': step_name,
-                                             'data': open(screenshot_name, 'rb'),
-                                             'mime': 'application/octet-stream'
-                                         },
-                                         item_id=item_id
-                                         )
+            # The screen is grabbed now, the image is encoded and the log sent from the screenshot worker
+            def send(attachment):
+                self.service.log_step_result(end_time=end_time,
+                                             message=message,
+                                             level='ERROR',
+                                             attachment=attachment,
+                                             item_id=item_id)
+
+            if screenshots is None:
+                self.screenshots.capture(step_name, send)
+            else:
+                send(screenshots[0] if screenshots else None)
         else:
-            self.service.log_step_result(end_time=timestamp(),
-                                         message=error_msg,
+            self.service.log_step_result(end_time=end_time,
+                                         message=message,
                                          level='ERROR',
+                                         attachment=full_error,
                                          item_id=item_id)
 
+    @timed_hook
     def launch_service(self, attributes=None, tags=None):
         """
         Start the service that will communicate results to ReportPortal
@@ -71,13 +199,34 @@ class BehaveIntegrationService:
         :param tags: the tags the test execution was triggered with
         :return: the id of the launch required to mark it complete
         """
-        if self.rp_enable:
+        if self.profiler:
+            self.profiler.start('run')
+        if self.rp_enable and self.rerun:
+            # The retried scenarios are reported into the launch of the original run
+            launch_id = self.rerun_launch_id or (self.rerun_index and self.rerun_index.launch_id)
+            if not launch_id:
+                raise ValueError("rerun requires rerun_launch_id or a rerun index written by the original run")
+            return self.service.rerun_launcher(launch_id=launch_id,
+                                               name=self.rp_launch_name,
+                                               start_time=timestamp(),
+                                               description=self.rp_launch_description,
+                                               attributes=attributes)
+        elif self.rp_enable and self.launch_coordinator:
+            # Parallel workers share one launch, only the first one actually starts it
+            return self.launch_coordinator.join(name=self.rp_launch_name,
+                                                start_time=timestamp(),
+                                                description=self.rp_launch_description,
+                                                attributes=attributes,
+                                                tags=tags)
+        elif self.rp_enable:
             return self.service.start_launcher(name=self.rp_launch_name,
                                                start_time=timestamp(),
                                                description=self.rp_launch_description,
                                                attributes=attributes,
                                                tags=tags)
 
+    @timed_hook
+    @profiled_hook('feature')
     def before_feature(self, feature, attributes=None):
         """
         Log the start of a feature execution
@@ -87,14 +236,24 @@ class BehaveIntegrationService:
         """
         if self.rp_enable:
             feature_info = Feature(feature)
-            return self.service.start_feature_test(name=feature_info.name,
-                                                   description=feature_info.description,
-                                                   attributes=attributes,
-                                                   tags=feature_info.tags,
-                                                   start_time=timestamp(),
-                                                   item_type=feature_info.item_type,
-                                                   parent_item_id=None)
+            if self.rerun and self.rerun_index and self.rerun_index.get(feature):
+                # The feature suite of the original run is reused, the retried scenarios are reported under it
+                feature_id = self.rerun_index.get(feature)
+                self._rerun_features.add(feature_id)
+                return feature_id
+            feature_id = self.service.start_feature_test(name=feature_info.name,
+                                                         description=feature_info.description,
+                                                         attributes=attributes,
+                                                         tags=feature_info.tags,
+                                                         start_time=timestamp(),
+                                                         item_type=feature_info.item_type,
+                                                         parent_item_id=None)
+            if self.rerun_index:
+                self.rerun_index.record(feature, feature_id)
+            return feature_id
 
+    @timed_hook
+    @profiled_hook('scenario')
     def before_scenario(self, scenario, feature_id, attributes=None):
         """
         Log the start of a scenario execution
@@ -105,14 +264,22 @@ class BehaveIntegrationService:
         """
         if self.rp_enable:
             scenario_info = Scenario(scenario, feature_id=feature_id)
-            return self.service.start_scenario_test(name=scenario_info.name,
-                                                    description=scenario_info.description,
-                                                    attributes=attributes,
-                                                    tags=scenario_info.tags,
-                                                    start_time=timestamp(),
-                                                    item_type=scenario_info.item_type,
-                                                    parent_item_id=scenario_info.feature_id)
+            # A scenario that was reported by the original run is reported as a retry of its item
+            retry = bool(self.rerun and self.rerun_index and self.rerun_index.get(scenario))
+            scenario_id = self.service.start_scenario_test(name=scenario_info.name,
+                                                           description=scenario_info.description,
+                                                           attributes=attributes,
+                                                           tags=scenario_info.tags,
+                                                           start_time=timestamp(),
+                                                           item_type=scenario_info.item_type,
+                                                           parent_item_id=scenario_info.feature_id,
+                                                           retry=retry)
+            if self.rerun_index and not retry:
+                self.rerun_index.record(scenario, scenario_id)
+            return scenario_id
 
+    @timed_hook
+    @profiled_hook('step')
     def before_step(self, step, scenario_id, attributes=None):
         """
         Logs the start of a step execution.
@@ -122,16 +289,24 @@ class BehaveIntegrationService:
         :param attributes: the attributes to label the step with
         :return: the id of the step execution required to mark it complete
         """
-        if self.rp_enable and self.step_based:
-            step_info = Step(step, scenario_id=scenario_id)
+        if self.rp_enable and self.step_buffer is not None:
+            self.step_buffer.start_step(step, timestamp(), attributes)
+        elif self.rp_enable and self.step_based:
+            return self._start_step(step, scenario_id, start_time=timestamp(), attributes=attributes)
 
-            return self.service.start_step_test(name=f"{step_info.keyword} {step_info.name}",
-                                                start_time=timestamp(),
-                                                item_type=step_info.item_type,
-                                                description=step_info.description,
-                                                attributes=attributes,
-                                                parent_item_id=step_info.scenario_id)
+    def _start_step(self, step, scenario_id, start_time, attributes=None):
+        step_info = Step(step, scenario_id=scenario_id)
+        return self.service.start_step_test(name=f"{step_info.keyword} {step_info.name}",
+                                            start_time=start_time,
+                                            item_type=step_info.item_type,
+                                            description=self.payload_policy.render(step_info.name,
+                                                                                   step_info.iter_description(),
+                                                                                   attach=False)[0],
+                                            attributes=attributes,
+                                            parent_item_id=step_info.scenario_id)
 
+    @timed_hook
+    @profiled_hook('step')
     def after_step(self, step, step_id):
         """
         Mark the step as complete and set the status for it
@@ -139,55 +314,79 @@ class BehaveIntegrationService:
         :param step_id: the id of the step execution received from the before_step
         :return: response of the step completion if available
         """
+        if not self.rp_enable:
+            return
+        if self.step_buffer is not None:
+            record = self.step_buffer.finish_step(step, timestamp())
+            if step.status == 'failed' and self.add_screenshot:
+                # The screen has to be grabbed now, it is only uploaded if the scenario is reported in full
+                self.screenshots.capture(step.name, record.screenshots.append)
+            return
+        return self._report_step(step, step_id)
+
+    def _report_step(self, step, step_id, end_time=None, screenshots=None):
+        """
+        Log the result of a step and finish it in step based mode
+        :param step: the behave step
+        :param step_id: the id of the step execution
+        :param end_time: the time the step finished, now if not set
+        :param screenshots: screenshots captured when the step failed, taken now if not set
+        :return: response of the step completion if available
+        """
         step_info = Step(step, step_id=step_id)
-        if self.rp_enable and self.step_based:
+        if self.step_based:
             # Finishes step
             if step.status == 'failed':
-                # Takes a demo screenshot of desktop (can be removed)
-
                 self.log_step_error_result(error_msg=f"{step.exception}",
                                            step_name=step_info.name,
-                                           item_id=step_info.step_id)
-                self.log_step_error_result(error_msg=u"".join(traceback.format_tb(step.exc_traceback)),
+                                           item_id=step_info.step_id,
+                                           screenshot=True,
+                                           end_time=end_time,
+                                           screenshots=screenshots)
+                self.log_step_error_result(error_msg=traceback.format_tb(step.exc_traceback),
                                            step_name=step_info.name,
-                                           item_id=step_info.step_id)
-                return self.service.finish_step_test(end_time=timestamp(),
+                                           item_id=step_info.step_id,
+                                           end_time=end_time)
+                return self.service.finish_step_test(end_time=end_time or timestamp(),
                                                      status='FAILED',
                                                      item_id=step_info.step_id)
             else:
-                return self.service.finish_step_test(end_time=timestamp(),
+                return self.service.finish_step_test(end_time=end_time or timestamp(),
                                                      status='PASSED',
                                                      item_id=step_info.step_id)
 
         # Else SCENARIO based logging will be used
-        elif self.rp_enable:
-            # Creates text log message with INFO level.
+        else:
+            # Creates text log message with INFO level, large tables and texts are attached instead
             if step.table:
-                message = '%s %s\n~~~~~~~~~~~~~~~~~~~~~~~~~\nStep data table:\n%s' % (
-                    step_info.keyword,
-                    step_info.name,
-                    step_info.description)
+                header = [f"{step_info.keyword} {step_info.name}\n~~~~~~~~~~~~~~~~~~~~~~~~~\nStep data table:\n"]
             elif step.text:
-                message = '%s %s\n~~~~~~~~~~~~~~~~~~~~~~~~~\nStep data text:\n%s' % (
-                    step_info.keyword,
-                    step_info.name,
-                    step_info.description)
+                header = [f"{step_info.keyword} {step_info.name}\n~~~~~~~~~~~~~~~~~~~~~~~~~\nStep data text:\n"]
             else:
-                message = step_info.description
-            self.service.log_step_result(end_time=timestamp(),
+                header = []
+            message, attachment = self.payload_policy.render(step_info.name,
+                                                             itertools.chain(header, step_info.iter_description()))
+            self.service.log_step_result(end_time=end_time or timestamp(),
                                          message=message,
                                          level='INFO',
+                                         attachment=attachment,
                                          item_id=step_info.step_id)
 
             if step.status == 'failed':
                 # Logs assertion message with attachment and ERROR level it step was failed.
                 self.log_step_error_result(error_msg=f"{step.exception}",
                                            step_name=step_info.name,
-                                           item_id=step_info.step_id)
-                self.log_step_error_result(error_msg=u"".join(traceback.format_tb(step.exc_traceback)),
+                                           item_id=step_info.step_id,
+                                           screenshot=True,
+                                           end_time=end_time,
+                                           screenshots=screenshots)
+                self.log_step_error_result(error_msg=traceback.format_tb(step.exc_traceback),
                                            step_name=step_info.name,
-                                           item_id=step_info.step_id)
+                                           item_id=step_info.step_id,
+                                           end_time=end_time)
 
+    @timed_hook
+    @profiled_hook('scenario')
     def after_scenario(self, scenario, scenario_id):
         """
         Mark scenario as complete and set the status accordingly
@@ -196,23 +395,29 @@ class BehaveIntegrationService:
         :return: response of the scenario completion if available
         """
         if self.rp_enable:
+            if self.screenshots:
+                self.screenshots.flush()
+            if self.step_buffer is not None:
+                self._report_buffered_steps(scenario, scenario_id)
             scenario_info = Scenario(scenario, scenario_id=scenario_id)
+            # The undefined and skipped steps are reported together in a single log
+            # For example scenario marked by @skip tag and --tags=~@skip specified in params of run
+            undefined = []
+            skipped = []
             for step in scenario.steps:
                 if step.status.name == 'undefined':
-                    # Logs scenario if it is undefined
-                    self.service.log_step_result(end_time=timestamp(),
-                                                 message='%s %s - step is undefined.\n' % (
-                                                     step.keyword, step.name),
-                                                 level='WARN',
-                                                 item_id=scenario_info.scenario_id)
-                    # Logs scenario as skipped if it is marked for skip
-                    # For example scenario marked by @skip tag and --tags=~@skip specified in params of run
+                    undefined.append(f"{step.keyword} {step.name} - step is undefined.")
                 elif step.status.name == 'skipped':
-                    self.service.log_step_result(end_time=timestamp(),
-                                                 message='%s %s - %s' % (
-                                                     step.keyword, step.name, step.status.name.capitalize()),
-                                                 level='TRACE',
-                                                 item_id=scenario_info.scenario_id)
+                    skipped.append(f"{step.keyword} {step.name} - Skipped")
+            if undefined or skipped:
+                message, attachment = self.payload_policy.render(
+                    f"{scenario.name} steps not run",
+                    f"{len(undefined)} undefined and {len(skipped)} skipped steps:\n" + '\n'.join(undefined + skipped))
+                self.service.log_step_result(end_time=timestamp(),
+                                             message=message,
+                                             level='WARN' if undefined else 'TRACE',
+                                             attachment=attachment,
+                                             item_id=scenario_info.scenario_id)
             #   Finishes scenario
             if scenario.status == 'failed':
                 status = "FAILED"
@@ -220,8 +425,38 @@ class BehaveIntegrationService:
                 status = "PASSED"
             return self.service.finish_scenario_test(end_time=timestamp(),
                                                      status=status,
-                                                     item_id=scenario_info.scenario_id)
+                                                     item_id=scenario_info.scenario_id,
+                                                     attributes=self._duration_attributes('scenario'))
+
+    def _report_buffered_steps(self, scenario, scenario_id):
+        """
+        Upload the buffered steps of a scenario in full, or a summary log of them if the scenario passed
+        :param scenario: the behave scenario
+        :param scenario_id: the id of the scenario execution
+        :return: None
+        """
+        try:
+            if self.step_buffer.report_in_full(scenario):
+                for record in self.step_buffer.records:
+                    step_id = None
+                    if self.step_based:
+                        step_id = self._start_step(record.step, scenario_id,
+                                                   start_time=record.start_time,
+                                                   attributes=record.attributes)
+                    self._report_step(record.step, step_id, end_time=record.end_time, screenshots=record.screenshots)
+            elif self.step_buffer.records:
+                message, attachment = self.payload_policy.render(f"{scenario.name} summary",
+                                                                 self.step_buffer.summary())
+                self.service.log_step_result(end_time=timestamp(),
+                                             message=message,
+                                             level='INFO',
+                                             attachment=attachment,
+                                             item_id=scenario_id)
+        finally:
+            self.step_buffer.clear()
 
+    @timed_hook
+    @profiled_hook('feature')
     def after_feature(self, feature, feature_id, attributes=None):
         """
         Mark the feature as complete and set the status accordingly
@@ -231,22 +466,22 @@ class BehaveIntegrationService:
         :return: response of the feature completion if available
         """
         if self.rp_enable:
+            if feature_id in self._rerun_features:
+                # The feature suite belongs to the original run, which already finished it
+                self._rerun_features.discard(feature_id)
+                return None
             feature_info = Feature(feature, feature_id=feature_id)
-            for scenario in feature.scenarios:
-                try:
-                    if 'skip' in scenario.tags:
-                        scenario_id = self.service.start_scenario_test(name='Scenario: %s' % scenario.name,
-                                                                       description=scenario.description,
-                                                                       attributes=attributes,
-                                                                       tags=feature_info.tags,
-                                                                       start_time=timestamp(),
-                                                                       item_type='SCENARIO',
-                                                                       parent_item_id=feature_info.feature_id)
-                        self.service.finish_scenario_test(end_time=timestamp(),
-                                                          status='SKIPPED',
-                                                          item_id=scenario_id)
-                except IndexError:
-                    pass
+            skipped_scenarios = self._skipped_scenarios(feature)
+            if skipped_scenarios:
+                now = timestamp()
+                self.service.report_skipped_scenarios(scenarios=[{'name': 'Scenario: %s' % scenario.name,
+                                                                  'description': scenario.description}
+                                                                 for scenario in skipped_scenarios],
+                                                      attributes=attributes,
+                                                      tags=feature_info.tags,
+                                                      start_time=now,
+                                                      end_time=now,
+                                                      parent_item_id=feature_info.feature_id)
             #   Finishes feature
             if feature.status == 'failed':
                 status = "FAILED"
@@ -254,8 +489,10 @@ class BehaveIntegrationService:
                 status = "PASSED"
             return self.service.finish_feature(end_time=timestamp(),
                                                status=status,
-                                               item_id=feature_info.feature_id)
+                                               item_id=feature_info.feature_id,
+                                               attributes=self._duration_attributes('feature'))
 
+    @timed_hook
     def after_all(self, launch_id):
         """
         Finish the test execution and terminate the RP service
@@ -263,6 +500,73 @@ class BehaveIntegrationService:
         :return: response of the test execution completion if available
         """
         if self.rp_enable:
-            launch_completion = self.service.finish_launcher(end_time=timestamp(), launch_id=launch_id)
+            if self.screenshots:
+                self.screenshots.shutdown()
+            if self.profiler:
+                try:
+                    self._report_profile()
+                except Exception:
+                    # The profile is a by-product, failing to send it must not leave the launch unfinished
+                    reportportal_error_handler(sys.exc_info(), self.metrics)
+            # Everything reported so far is sent first: the metrics then count every request, and in a shared launch
+            # the last worker to leave cannot finish the launch before the events of this one are sent
+            self.service.drain()
+            attributes = self.metrics.as_attributes() if self.metrics_attributes else None
+            if self.launch_coordinator and not self.rerun:
+                # Only the last worker to leave the shared launch finishes it
+                launch_completion = self.launch_coordinator.leave(end_time=timestamp(), attributes=attributes)
+            else:
+                launch_completion = self.service.finish_launcher(end_time=timestamp(),
+                                                                 launch_id=launch_id,
+                                                                 attributes=attributes)
+            if self.rerun_index:
+                self._save_rerun_index(launch_id)
             self.service.terminate_service()
+            if self.metrics_file:
+                self.metrics.write_json(self.metrics_file)
             return launch_completion
+
+    def _save_rerun_index(self, launch_id):
+        """
+        Write the rerun index once every item id is known
+        :param launch_id: the id of the execution
+        :return: None
+        """
+        resolve_id = getattr(self.service, 'resolve_id', None)
+        if not self.rerun or not self.rerun_index.launch_id:
+            self.rerun_index.launch_id = resolve_id(launch_id) if resolve_id else launch_id
+        self.rerun_index.save(resolve_id=resolve_id)
+
+    @staticmethod
+    def _skipped_scenarios(feature):
+        """
+        :param feature: the behave feature
+        :return: the scenarios of the feature tagged @skip, every scenario inherits the tag of a @skip feature
+        """
+        if 'skip' in feature.tags:
+            return list(feature.scenarios)
+        return [scenario for scenario in feature.scenarios if 'skip' in scenario.tags]
+
+    def _duration_attributes(self, level):
+        """
+        :param level: feature or scenario
+        :return: the attributes with the profiled duration of the item that just ended, if profile_attributes is set
+        """
+        if self.profiler and self.profile_attributes and level in self.profiler.last:
+            return {'duration_ms': int(self.profiler.last[level] * 1000)}
+        return None
+
+    def _report_profile(self):
+        """
+        Log the profile of the run to the launch, the full statistics are attached as JSON
+        :return: None
+        """
+        self.profiler.finish('run')
+        reporting_time = self.metrics.as_attributes()['rp_hooks_ms'] / 1000
+        message, profile = self.profiler.report(reporting_time=reporting_time)
+        self.service.log_step_result(end_time=timestamp(),
+                                     message=message,
+                                     level='INFO',
+                                     attachment={'name': 'step_profile.json', 'data': profile,
+                                                 'mime': 'application/json'},
+                                     item_id=None)
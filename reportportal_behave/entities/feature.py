@@ -1,8 +1,23 @@
 class Feature:
+    __slots__ = ('_feature', 'feature_id', '_description')
+
+    item_type = "SUITE"
 
     def __init__(self, feature, feature_id=None):
-        self.name = feature.name
-        self.description = f"Feature description:\n {feature.description} \n"
-        self.tags = feature.tags
-        self.item_type = "SUITE"
+        self._feature = feature
         self.feature_id = feature_id
+        self._description = None
+
+    @property
+    def name(self):
+        return self._feature.name
+
+    @property
+    def tags(self):
+        return self._feature.tags
+
+    @property
+    def description(self):
+        if self._description is None:
+            self._description = f"Feature description:\n {self._feature.description} \n"
+        return self._description
@@ -1,9 +1,21 @@
 class Scenario:
+    __slots__ = ('_scenario', 'feature_id', 'scenario_id')
+
+    item_type = "SCENARIO"
 
     def __init__(self, scenario, feature_id=None, scenario_id=None):
-        self.name = f"Scenario: {scenario.name}"
-        self.description = scenario.name
-        self.tags = scenario.tags
-        self.item_type = "SCENARIO"
+        self._scenario = scenario
         self.feature_id = feature_id
         self.scenario_id = scenario_id
+
+    @property
+    def name(self):
+        return f"Scenario: {self._scenario.name}"
+
+    @property
+    def description(self):
+        return self._scenario.name
+
+    @property
+    def tags(self):
+        return self._scenario.tags
@@ -1,18 +1,47 @@
+from reportportal_behave.payload import iter_chunks
+
+
 class Step:
+    __slots__ = ('_step', 'scenario_id', 'step_id', '_description')
+
+    item_type = "STEP"
 
     def __init__(self, step, scenario_id=None, step_id=None):
-        self.name = step.name
-        self.keyword = step.keyword
-        self.item_type = "STEP"
+        self._step = step
         self.scenario_id = scenario_id
         self.step_id = step_id
-        if step.table:
-            table_data = []
-            for row in step.table.rows:
-                table_data.append('|'.join(row))
-            self.description = "|%s|" % '|\n|'.join(table_data)
-        elif step.text:
+        self._description = None
+
+    @property
+    def name(self):
+        return self._step.name
+
+    @property
+    def keyword(self):
+        return self._step.keyword
+
+    @property
+    def description(self):
+        # Rendering a data table is the expensive part, so it is only done when a payload needs it
+        if self._description is None:
+            self._description = ''.join(self.iter_description())
+        return self._description
+
+    def iter_description(self):
+        """
+        Render the description piece by piece, so that large data tables and texts can be streamed
+        :return: generator of string chunks
+        """
+        if self._description is not None:
+            yield self._description
+        elif self._step.table:
+            separator = '|'
+            for row in self._step.table.rows:
+                yield f"{separator}{'|'.join(row)}"
+                separator = '|\n|'
+            yield '|'
+        elif self._step.text:
             # Logs step with text if it was provided
-            self.description = step.text
+            yield from iter_chunks(self._step.text)
         else:
-            self.description = f"{self.keyword} {self.name}"
+            yield f"{self.keyword} {self.name}"
@@ -0,0 +1,170 @@
+import gzip
+import logging
+import threading
+from time import monotonic
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+OVERLOAD_STATUSES = (429, 503)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# A POST that failed with a read error or a 500/502/504 may still have created the item or log, only the requests that
+# can be sent twice are retried then. Every request is retried when the connection could not be made or the server
+# rejected it as overloaded.
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'))
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limits the number of requests in flight with additive increase / multiplicative decrease:
+    the limit is halved whenever the server signals overload and grows back by one request per
+    window of successful requests. A Retry-After header pauses all the requests for that long.
+    """
+
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self._in_flight = 0
+        self._paused_until = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while True:
+                pause = self._paused_until - monotonic()
+                if pause > 0:
+                    self._condition.wait(pause)
+                elif self._in_flight >= int(self.limit):
+                    self._condition.wait()
+                else:
+                    self._in_flight += 1
+                    return
+
+    def release(self, overloaded=False, retry_after=None):
+        with self._condition:
+            self._in_flight -= 1
+            if overloaded:
+                self.limit = max(1.0, self.limit / 2)
+                logger.debug("ReportPortal is overloaded, lowering the concurrency limit to %s", int(self.limit))
+                if retry_after:
+                    self._paused_until = max(self._paused_until, monotonic() + retry_after)
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class TunedHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that gzips request bodies over a size threshold and goes through an AdaptiveConcurrencyLimiter
+    """
+
+    def __init__(self, compress_threshold=None, limiter=None, **kwargs):
+        self.compress_threshold = compress_threshold
+        self.limiter = limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if self.compress_threshold is not None:
+            _compress(request, self.compress_threshold)
+        if self.limiter is None:
+            return super().send(request, **kwargs)
+
+        self.limiter.acquire()
+        response = None
+        try:
+            response = super().send(request, **kwargs)
+            return response
+        finally:
+            overloaded, retry_after = _overload_signal(response)
+            self.limiter.release(overloaded=overloaded, retry_after=retry_after)
+
+
+class OverloadRetry(Retry):
+    """
+    Retry policy that also retries the non idempotent requests rejected with 429 or 503: the server did not process
+    them, so sending them again cannot duplicate an item or a log
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code in OVERLOAD_STATUSES and self.status_forcelist and status_code in self.status_forcelist:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def configure_session(session,
+                      pool_size=50,
+                      keep_alive=True,
+                      retries=3,
+                      backoff_factor=0.5,
+                      backoff_jitter=0.5,
+                      compress_threshold=None,
+                      max_concurrency=None):
+    """
+    Mount a tuned adapter on the requests session used by the ReportPortalService
+    :param session: the requests.Session to configure
+    :param pool_size: the number of connections kept open to ReportPortal
+    :param keep_alive: reuse the connections between requests
+    :param retries: how many times a request failing with a connection error or a 429/503 response is retried; the
+                    idempotent requests, e.g. the item finishes, are also retried on read errors and 500/502/504
+    :param backoff_factor: the base of the exponential backoff between retries, in seconds
+    :param backoff_jitter: the maximum random delay in seconds added to every backoff
+    :param compress_threshold: gzip request bodies larger than this many bytes, None disables compression.
+                               The server, or the proxy in front of it, has to accept gzip encoded requests
+    :param max_concurrency: the maximum number of requests in flight, lowered automatically when ReportPortal
+                            answers with 429 or 503. None disables the limiter
+    :return: the session
+    """
+    retry_kwargs = dict(total=retries,
+                        backoff_factor=backoff_factor,
+                        status_forcelist=RETRY_STATUSES,
+                        allowed_methods=IDEMPOTENT_METHODS,
+                        respect_retry_after_header=True,
+                        raise_on_status=False)
+    try:
+        retry = OverloadRetry(backoff_jitter=backoff_jitter, **retry_kwargs)
+    except TypeError:
+        # backoff_jitter is only available from urllib3 2
+        retry = OverloadRetry(**retry_kwargs)
+    limiter = AdaptiveConcurrencyLimiter(max_concurrency) if max_concurrency else None
+    adapter = TunedHTTPAdapter(compress_threshold=compress_threshold,
+                               limiter=limiter,
+                               pool_connections=pool_size,
+                               pool_maxsize=pool_size,
+                               max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
+    return session
+
+
+def _compress(request, threshold):
+    body = request.body
+    if body is None or 'Content-Encoding' in request.headers:
+        return
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if not isinstance(body, bytes) or len(body) < threshold:
+        return
+    request.body = gzip.compress(body, compresslevel=5)
+    request.headers['Content-Encoding'] = 'gzip'
+    request.headers['Content-Length'] = str(len(request.body))
+
+
+def _overload_signal(response):
+    if response is None:
+        return False, None
+    statuses = [response.status_code]
+    retries = getattr(response.raw, 'retries', None)
+    if retries is not None:
+        statuses.extend(attempt.status for attempt in retries.history)
+    overloaded = any(status in OVERLOAD_STATUSES for status in statuses)
+    retry_after = None
+    if overloaded:
+        try:
+            retry_after = float(response.headers.get('Retry-After', ''))
+        except ValueError:
+            pass
+    return overloaded, retry_after
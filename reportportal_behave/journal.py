@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+ID_ARGUMENTS = ('item_id', 'parent_item_id', 'launch_id')
+
+
+class EventJournal:
+    """
+    Append-only journal of the calls made to an IntegrationService, one compact JSON object per line.
+    Attachments are written next to the journal, in the <journal>.attachments directory, and referenced by path.
+    """
+
+    def __init__(self, path, buffer_size=1024 * 1024, stream=None):
+        """
+        :param path: the path of the journal, the attachments are written next to it
+        :param buffer_size: the number of bytes buffered before they are written
+        :param stream: a text stream to write the events to instead of the file at path
+        """
+        self.path = path
+        self.attachments_dir = f"{path}.attachments"
+        self._file = stream or open(path, 'a', buffering=buffer_size, encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def append(self, method, kwargs, item_id=None):
+        """
+        Write an event to the journal
+        :param method: the name of the IntegrationService method that was called
+        :param kwargs: the arguments of the call
+        :param item_id: the local id returned by the call, for the start methods
+        :return: None
+        """
+        attachment = kwargs.get('attachment')
+        if attachment:
+            kwargs = dict(kwargs, attachment=self._store_attachment(attachment))
+        event = {'m': method, 'kw': kwargs}
+        if item_id:
+            event['id'] = item_id
+        line = json.dumps(event, separators=(',', ':'), default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def _store_attachment(self, attachment):
+        data = attachment['data']
+        if hasattr(data, 'read'):
+            with data:
+                data = data.read()
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        os.makedirs(self.attachments_dir, exist_ok=True)
+        path = os.path.join(self.attachments_dir, uuid.uuid4().hex)
+        with open(path, 'wb') as attachment_file:
+            attachment_file.write(data)
+        return {'name': attachment.get('name'), 'mime': attachment.get('mime'), 'path': path}
+
+
+def read_events(path, offset=0):
+    """
+    Read the events of a journal
+    :param path: the path of the journal
+    :param offset: the byte offset to start reading from
+    :return: generator of (event, offset of the next event) tuples
+    """
+    with open(path, 'rb') as journal:
+        journal.seek(offset)
+        for line in journal:
+            offset += len(line)
+            if not line.endswith(b'\n'):
+                # The writer was interrupted in the middle of this event
+                logger.warning("Ignoring incomplete event at the end of %s", path)
+                return
+            yield json.loads(line), offset
+
+
+def load_attachment(attachment):
+    """
+    Turn an attachment reference written by the journal back into an attachment
+    :param attachment: dict with the name, mime and path of the attachment
+    :return: dict with the name, data and mime of the attachment
+    """
+    with open(attachment['path'], 'rb') as attachment_file:
+        data = attachment_file.read()
+    return {'name': attachment['name'], 'data': data, 'mime': attachment['mime'] or 'application/octet-stream'}
+
+
+class SpoolingIntegrationService:
+    """
+    Stands in for the IntegrationService and writes every call to an EventJournal instead of sending it.
+    The journal is sent to ReportPortal later on with the rp-behave-replay command.
+    """
+
+    id_prefix = 'spool'
+
+    def __init__(self, journal_path):
+        self.journal = EventJournal(journal_path)
+
+    def start_launcher(self, **kwargs):
+        return self._start('start_launcher', kwargs)
+
+    def rerun_launcher(self, **kwargs):
+        return self._start('rerun_launcher', kwargs)
+
+    def join_launcher(self, **kwargs):
+        self.journal.append('join_launcher', kwargs)
+
+    def start_feature_test(self, **kwargs):
+        return self._start('start_feature_test', kwargs)
+
+    def start_scenario_test(self, **kwargs):
+        return self._start('start_scenario_test', kwargs)
+
+    def start_step_test(self, **kwargs):
+        return self._start('start_step_test', kwargs)
+
+    def report_skipped_scenarios(self, **kwargs):
+        self.journal.append('report_skipped_scenarios', kwargs)
+
+    def finish_step_test(self, **kwargs):
+        self.journal.append('finish_step_test', kwargs)
+
+    def finish_scenario_test(self, **kwargs):
+        self.journal.append('finish_scenario_test', kwargs)
+        self.journal.flush()
+
+    def finish_feature(self, **kwargs):
+        self.journal.append('finish_feature', kwargs)
+        self.journal.flush()
+
+    def finish_launcher(self, **kwargs):
+        self.journal.append('finish_launcher', kwargs)
+        self.journal.flush()
+
+    def log_step_result(self, **kwargs):
+        self.journal.append('log_step_result', kwargs)
+
+    def flush_logs(self):
+        self.journal.flush()
+
+    def drain(self):
+        self.journal.flush()
+
+    def terminate_service(self):
+        self.journal.close()
+
+    def _start(self, method, kwargs):
+        item_id = f"{self.id_prefix}-{uuid.uuid4()}"
+        self.journal.append(method, kwargs, item_id=item_id)
+        return item_id
@@ -0,0 +1,331 @@
+import argparse
+import codecs
+import json
+import logging
+import os
+import re
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from time import monotonic
+from types import SimpleNamespace
+
+from reportportal_behave.entities.feature import Feature
+from reportportal_behave.entities.scenario import Scenario
+from reportportal_behave.entities.step import Step
+from reportportal_behave.payload import PayloadPolicy
+from reportportal_behave.reportportal_service import IntegrationService, reportportal_error_handler
+
+logger = logging.getLogger(__name__)
+
+_SEPARATORS = re.compile(r'[\s,]*')
+
+# behave statuses without a ReportPortal counterpart are reported as skipped
+_STATUSES = {'passed': 'PASSED', 'failed': 'FAILED', 'error': 'FAILED'}
+
+
+class BehaveJsonImporter:
+    """
+    Uploads a report written by the behave json formatter (`behave -f json`) to ReportPortal.
+    The report is decoded one feature at a time and the features are uploaded by parallel workers, so the memory
+    used is bounded by the largest feature rather than by the report. behave only records the duration of the steps,
+    the timestamps of the items are rebuilt by laying the steps out one after the other from the launch start.
+    Without a start time the launch is laid out to end when the report was written, which takes a first pass over
+    the report to add the durations up.
+    """
+
+    def __init__(self, service, workers=8, log_batch_size=20, step_based=False, payload_policy=None):
+        """
+        :param service: the IntegrationService used to send the results
+        :param workers: the number of features uploaded at the same time
+        :param log_batch_size: the maximum number of logs per request, every worker batches the logs of its feature
+        :param step_based: report the steps as items instead of logs of their scenario
+        :param payload_policy: the PayloadPolicy bounding the size of the logs
+        """
+        self.service = service
+        self.workers = workers
+        self.log_batch_size = log_batch_size
+        self.step_based = step_based
+        self.payload_policy = payload_policy or PayloadPolicy()
+        self.counts = Counter()
+        self.failed = False
+        self._lock = Lock()
+
+    def import_report(self, report_path, launch_name, description=None, attributes=None, start_time=None):
+        """
+        Upload a behave JSON report as a new launch
+        :param report_path: the path of the report
+        :param launch_name: the name of the launch
+        :param description: the description of the launch
+        :param attributes: the attributes to label the launch with
+        :param start_time: the start of the launch in milliseconds since the epoch; if not set the launch ends when
+                           the report was written
+        :return: True if every feature was uploaded
+        """
+        cursor = start_time
+        if not cursor:
+            # The formatter writes the report as the run goes, its last write is the end of the run
+            cursor = int(os.path.getmtime(report_path) * 1000) - _report_duration(report_path)
+        launch_id = self.service.start_launcher(name=launch_name,
+                                                start_time=str(cursor),
+                                                description=description,
+                                                attributes=attributes)
+        # Only a few features are decoded ahead of the workers
+        slots = BoundedSemaphore(self.workers * 2)
+        with open(report_path, 'rb') as report, ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for feature in iter_json_array(report):
+                if self.failed:
+                    break
+                slots.acquire()
+                future = executor.submit(self._import_feature, feature, cursor)
+                future.add_done_callback(lambda _: slots.release())
+                cursor += _feature_duration(feature)
+                self.counts['bytes'] = report.tell()
+        self.service.finish_launcher(end_time=str(cursor), launch_id=launch_id)
+        return not self.failed
+
+    def _import_feature(self, feature, start_time):
+        try:
+            feature_info = Feature(_model(feature))
+            feature_id = self.service.start_feature_test(name=feature_info.name,
+                                                         description=feature_info.description,
+                                                         tags=feature_info.tags,
+                                                         start_time=str(start_time),
+                                                         item_type=feature_info.item_type,
+                                                         parent_item_id=None)
+            cursor = start_time
+            logs = []
+            for element in feature.get('elements', ()):
+                # Background steps are repeated in every scenario, the background element holds no results
+                if element.get('type') == 'scenario':
+                    cursor = self._import_scenario(element, feature_id, cursor, logs)
+            self._send_logs(logs)
+            self.service.finish_feature(end_time=str(cursor),
+                                        status=_status(feature.get('status')),
+                                        item_id=feature_id)
+            self._count('features')
+        except Exception:
+            self.failed = True
+            reportportal_error_handler(sys.exc_info())
+
+    def _import_scenario(self, scenario, feature_id, start_time, logs):
+        scenario_info = Scenario(_model(scenario), feature_id=feature_id)
+        scenario_id = self.service.start_scenario_test(name=scenario_info.name,
+                                                       description=scenario_info.description,
+                                                       tags=scenario_info.tags,
+                                                       start_time=str(start_time),
+                                                       item_type=scenario_info.item_type,
+                                                       parent_item_id=scenario_info.feature_id)
+        cursor = start_time
+        not_run = []
+        for step in scenario.get('steps', ()):
+            result = step.get('result', {})
+            status = result.get('status', 'untested')
+            if status in ('passed', 'failed'):
+                end_time = cursor + _milliseconds(result.get('duration'))
+                self._import_step(step, status, scenario_id, cursor, end_time, logs)
+                cursor = end_time
+            else:
+                not_run.append(f"{step['keyword']} {step['name']} - {status}")
+        if not_run:
+            message, attachment = self.payload_policy.render(f"{scenario['name']} steps not run",
+                                                             f"{len(not_run)} steps not run:\n" + '\n'.join(not_run))
+            self._log(logs,
+                      end_time=str(cursor),
+                      message=message,
+                      level='WARN' if scenario.get('status') == 'undefined' else 'TRACE',
+                      attachment=attachment,
+                      item_id=scenario_id)
+        self.service.finish_scenario_test(end_time=str(cursor),
+                                          status=_status(scenario.get('status')),
+                                          item_id=scenario_id)
+        self._count('scenarios')
+        return cursor
+
+    def _import_step(self, step, status, scenario_id, start_time, end_time, logs):
+        step_info = Step(_model(step), scenario_id=scenario_id)
+        if self.step_based:
+            item_id = self.service.start_step_test(name=f"{step_info.keyword} {step_info.name}",
+                                                   start_time=str(start_time),
+                                                   item_type=step_info.item_type,
+                                                   description=self.payload_policy.render(step_info.name,
+                                                                                          step_info.iter_description(),
+                                                                                          attach=False)[0],
+                                                   parent_item_id=scenario_id)
+        else:
+            item_id = scenario_id
+            message, attachment = self.payload_policy.render(step_info.name, step_info.iter_description())
+            self._log(logs, end_time=str(end_time), message=message, level='INFO', attachment=attachment,
+                      item_id=item_id)
+        error_message = step['result'].get('error_message')
+        if error_message:
+            if not isinstance(error_message, str):
+                error_message = '\n'.join(error_message)
+            message, attachment = self.payload_policy.render(f"{step_info.name} error", error_message)
+            self._log(logs, end_time=str(end_time), message=message, level='ERROR', attachment=attachment,
+                      item_id=item_id)
+        if self.step_based:
+            self.service.finish_step_test(end_time=str(end_time), status=_status(status), item_id=item_id)
+        self._count('steps')
+
+    def _log(self, logs, **log):
+        logs.append(log)
+        if len(logs) >= self.log_batch_size:
+            self._send_logs(logs)
+
+    def _send_logs(self, logs):
+        """
+        Send the batched logs of a feature; they may reach ReportPortal after their item was finished
+        """
+        if not logs:
+            return
+        try:
+            self.service.log_batch(list(logs))
+            self._count('logs', len(logs))
+        finally:
+            for log in logs:
+                if log['attachment'] and hasattr(log['attachment'].get('data'), 'close'):
+                    log['attachment']['data'].close()
+            logs.clear()
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counts[name] += value
+
+
+def iter_json_array(stream, chunk_size=1024 * 1024):
+    """
+    Decode the items of a JSON array one at a time, reading the stream in chunks
+    :param stream: a binary file object holding a JSON array
+    :param chunk_size: the number of bytes read at once
+    :return: generator of the decoded items
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    is_started = False
+    is_eof = False
+    read_size = chunk_size
+    while True:
+        position = _SEPARATORS.match(buffer, position).end()
+        if position < len(buffer) and not is_started:
+            if buffer[position] != '[':
+                raise ValueError("The JSON report does not hold an array")
+            position += 1
+            is_started = True
+            continue
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        item = None
+        if position < len(buffer):
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if is_eof:
+                    raise
+        if item is not None:
+            read_size = chunk_size
+            yield item
+            continue
+        if is_eof:
+            raise ValueError("The JSON report ended before its array was closed")
+        # The next item does not fit the buffer, read more of it and twice as much on every further attempt
+        chunk = stream.read(read_size)
+        is_eof = not chunk
+        buffer = buffer[position:] + text_decoder.decode(chunk, final=is_eof)
+        position = 0
+        read_size *= 2
+
+
+def _model(data):
+    """
+    Expose a feature, scenario or step of the JSON report with the attributes of the behave model the entities read
+    """
+    text = data.get('text')
+    table = data.get('table')
+    description = data.get('description')
+    return SimpleNamespace(name=data.get('name', ''),
+                           keyword=data.get('keyword', ''),
+                           tags=data.get('tags', []),
+                           description='\n'.join(description) if isinstance(description, list) else description,
+                           text='\n'.join(text) if isinstance(text, list) else text,
+                           table=SimpleNamespace(rows=[table['headings']] + table['rows']) if table else None)
+
+
+def _report_duration(report_path):
+    with open(report_path, 'rb') as report:
+        return sum(_feature_duration(feature) for feature in iter_json_array(report))
+
+
+def _feature_duration(feature):
+    return sum(_milliseconds(step.get('result', {}).get('duration'))
+               for element in feature.get('elements', ()) if element.get('type') == 'scenario'
+               for step in element.get('steps', ()))
+
+
+def _milliseconds(seconds):
+    return int(round((seconds or 0) * 1000))
+
+
+def _status(status):
+    return _STATUSES.get(status, 'SKIPPED')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import a report of the behave json formatter into ReportPortal')
+    parser.add_argument('report', help='path of the JSON report')
+    parser.add_argument('--endpoint', default=os.environ.get('RP_ENDPOINT'), help='ReportPortal URL')
+    parser.add_argument('--project', default=os.environ.get('RP_PROJECT'), help='ReportPortal project')
+    parser.add_argument('--token', default=os.environ.get('RP_TOKEN'), help='ReportPortal token')
+    parser.add_argument('--verify-ssl', action='store_true', help='verify the SSL certificate of ReportPortal')
+    parser.add_argument('--launch-name', help='name of the launch, the name of the report by default')
+    parser.add_argument('--description', help='description of the launch')
+    parser.add_argument('--attribute', action='append', default=[], metavar='KEY:VALUE',
+                        help='attribute of the launch, can be repeated')
+    parser.add_argument('--start-time', type=int,
+                        help='start of the launch in milliseconds since the epoch, by default the launch ends when '
+                             'the report was written')
+    parser.add_argument('--step-based', action='store_true', help='report the steps as items')
+    parser.add_argument('--workers', type=int, default=8, help='number of features uploaded at the same time')
+    parser.add_argument('--log-batch-size', type=int, default=20, help='maximum number of logs per request')
+    args = parser.parse_args(argv)
+    if not (args.endpoint and args.project and args.token):
+        parser.error('--endpoint, --project and --token (or RP_ENDPOINT, RP_PROJECT and RP_TOKEN) are required')
+    logging.basicConfig(level=logging.INFO)
+
+    launch_name = args.launch_name or os.path.splitext(os.path.basename(args.report))[0]
+    service = IntegrationService(rp_endpoint=args.endpoint,
+                                 rp_project=args.project,
+                                 rp_token=args.token,
+                                 rp_launch_name=launch_name,
+                                 rp_launch_description=args.description,
+                                 verify_ssl=args.verify_ssl,
+                                 transport_options={'pool_size': args.workers, 'max_concurrency': args.workers})
+    importer = BehaveJsonImporter(service,
+                                  workers=args.workers,
+                                  log_batch_size=args.log_batch_size,
+                                  step_based=args.step_based)
+    started = monotonic()
+    succeeded = importer.import_report(args.report,
+                                       launch_name=launch_name,
+                                       description=args.description,
+                                       attributes=dict(attribute.split(':', 1) for attribute in args.attribute),
+                                       start_time=args.start_time)
+    service.terminate_service()
+    elapsed = monotonic() - started
+    counts = importer.counts
+    items = counts['features'] + counts['scenarios'] + counts['steps']
+    megabytes = counts['bytes'] / 1024 / 1024
+    logger.info("Imported %s features, %s scenarios, %s steps and %s logs (%.1f MB) in %.1fs (%.0f items/s, %.1f MB/s)",
+                counts['features'], counts['scenarios'], counts['steps'], counts['logs'], megabytes, elapsed,
+                items / elapsed if elapsed else 0, megabytes / elapsed if elapsed else 0)
+    if not succeeded:
+        logger.error("The import stopped on an error")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import os
+import socket
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+SHARED_LAUNCH_ID_ENV = 'RP_SHARED_LAUNCH_ID'
+
+
+class SharedLaunchCoordinator:
+    """
+    Lets several behave processes report into one launch.
+    The first worker to arrive starts the launch and writes its id to a rendezvous file, the following
+    workers join it and the last one to leave finishes it. The rendezvous file is guarded by a lock file,
+    so it works across processes on a machine or across nodes sharing the rendezvous directory.
+    A launch id exported in RP_SHARED_LAUNCH_ID is joined directly and never finished by the workers.
+    """
+
+    def __init__(self, service, launch_name, rendezvous_dir=None, workers=None, lock_timeout=60,
+                 state_ttl=24 * 60 * 60):
+        """
+        :param service: the IntegrationService of this worker
+        :param launch_name: the name of the launch, workers with the same name share the launch
+        :param rendezvous_dir: the directory holding the rendezvous file, the temp directory by default
+        :param workers: the number of workers expected to finish before the launch is finished; if not set
+                        the launch is finished when every worker that joined so far has left
+        :param lock_timeout: seconds after which a lock file is considered abandoned
+        :param state_ttl: seconds without any worker joining or leaving after which the rendezvous file is
+                          considered abandoned, e.g. because the workers crashed before finishing the launch
+        """
+        self.service = service
+        self.workers = workers
+        self.lock_timeout = lock_timeout
+        self.state_ttl = state_ttl
+        self.launch_id = None
+        self.is_external = False
+        key = hashlib.sha1(launch_name.encode('utf-8')).hexdigest()[:16]
+        rendezvous_dir = rendezvous_dir or tempfile.gettempdir()
+        self._state_path = os.path.join(rendezvous_dir, f"rp-shared-launch-{key}.json")
+        self._lock_path = f"{self._state_path}.lock"
+
+    def join(self, **launch_kwargs):
+        """
+        Start the shared launch, or join it if another worker already started it
+        :param launch_kwargs: the arguments of IntegrationService.start_launcher
+        :return: the id of the shared launch
+        """
+        external_launch_id = os.environ.get(SHARED_LAUNCH_ID_ENV)
+        if external_launch_id:
+            self.is_external = True
+            self.launch_id = external_launch_id
+            self.service.join_launcher(launch_id=external_launch_id)
+            return self.launch_id
+
+        with _FileLock(self._lock_path, self.lock_timeout):
+            state = self._read_state()
+            if state is not None and self._is_stale(state):
+                logger.warning("Ignoring abandoned shared launch %s, a new launch is started", state['launch_id'])
+                state = None
+            if state is None:
+                self.launch_id = self.service.start_launcher(**launch_kwargs)
+                state = {'launch_id': self.launch_id, 'joined': 0, 'finished': 0, 'active': []}
+                logger.debug("Started shared launch %s", self.launch_id)
+            else:
+                self.launch_id = state['launch_id']
+                self.service.join_launcher(launch_id=self.launch_id)
+                logger.debug("Joined shared launch %s", self.launch_id)
+            state['joined'] += 1
+            state['active'].append(_worker())
+            self._write_state(state)
+        return self.launch_id
+
+    def leave(self, end_time, attributes=None):
+        """
+        Leave the shared launch and finish it if this is the last worker
+        :param end_time: the end time of this worker
+        :param attributes: attributes added to the launch when it is finished
+        :return: the response of the launch completion if this worker finished it, None otherwise
+        """
+        if self.is_external:
+            return None
+
+        with _FileLock(self._lock_path, self.lock_timeout):
+            state = self._read_state()
+            if state is None or state['launch_id'] != self.launch_id:
+                logger.warning("Shared launch %s was already finished", self.launch_id)
+                return None
+            state['finished'] += 1
+            if _worker() in state.get('active', []):
+                state['active'].remove(_worker())
+            is_last = state['finished'] >= (self.workers or state['joined'])
+            if is_last:
+                os.remove(self._state_path)
+            else:
+                self._write_state(state)
+        if is_last:
+            return self.service.finish_launcher(end_time=end_time, launch_id=self.launch_id, attributes=attributes)
+        return None
+
+    def _is_stale(self, state):
+        """
+        The rendezvous file is abandoned if nobody joined or left for state_ttl seconds, or if every worker still in
+        the launch ran on this host and is gone
+        """
+        if time.time() - state.get('updated', 0) > self.state_ttl:
+            return True
+        active = state.get('active')
+        host = socket.gethostname()
+        return bool(active) and all(worker_host == host and not _is_alive(pid) for worker_host, pid in active)
+
+    def _read_state(self):
+        try:
+            with open(self._state_path) as state_file:
+                return json.load(state_file)
+        except FileNotFoundError:
+            return None
+
+    def _write_state(self, state):
+        state['updated'] = time.time()
+        temp_path = f"{self._state_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(temp_path, self._state_path)
+
+
+def _worker():
+    return [socket.gethostname(), os.getpid()]
+
+
+def _is_alive(pid):
+    if os.name != 'posix':
+        # Signal 0 only probes the process on POSIX
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _FileLock:
+
+    def __init__(self, path, timeout):
+        self.path = path
+        self.timeout = timeout
+
+    def __enter__(self):
+        while True:
+            try:
+                os.close(os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > self.timeout:
+                        logger.warning("Removing abandoned lock file %s", self.path)
+                        os.remove(self.path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.05)
+
+    def __exit__(self, *exc_info):
+        os.remove(self.path)
@@ -0,0 +1,126 @@
+import logging
+import os
+import threading
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+
+class LogBatcher:
+    """
+    Buffers log entries and attachments and sends them to ReportPortal as multipart batch requests.
+    A batch is sent as soon as it holds batch_size entries, grows past max_payload_size bytes
+    or its oldest entry is older than flush_interval seconds. The age is checked by a timer armed with the first entry
+    of every batch, so that the logs of a long step are sent while it runs.
+    """
+
+    def __init__(self, send_batch, batch_size=20, max_payload_size=10 * 1024 * 1024, flush_interval=5, metrics=None):
+        """
+        :param send_batch: callable sending a list of log entries, e.g. ReportPortalService.log_batch
+        :param batch_size: the maximum number of log entries in a batch
+        :param max_payload_size: the maximum size in bytes of the messages and attachments in a batch
+        :param flush_interval: the maximum number of seconds a log entry waits in the buffer
+        :param metrics: the ClientMetrics recording the number of buffered entries
+        """
+        self.send_batch = send_batch
+        self.metrics = metrics
+        self.batch_size = batch_size
+        self.max_payload_size = max_payload_size
+        self.flush_interval = flush_interval
+        self._entries = []
+        self._payload_size = 0
+        self._oldest = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def add(self, time, message, level='INFO', attachment=None, item_id=None):
+        """
+        Buffer a log entry and send the batch if one of the thresholds was hit
+        :param time: the time of the log entry
+        :param message: the message to log
+        :param level: the log level
+        :param attachment: dict with the name, data and mime of the file to attach
+        :param item_id: the id of the item to log to, the launch is used if None
+        :return: None
+        """
+        entry = {'time': time, 'message': message, 'level': level}
+        if item_id:
+            entry['itemUuid'] = item_id
+        if attachment:
+            entry['attachment'] = attachment
+        entry_size = len(message or '') + _attachment_size(attachment)
+        with self._lock:
+            if self._entries and self._payload_size + entry_size > self.max_payload_size:
+                self._flush()
+            self._entries.append(entry)
+            self._payload_size += entry_size
+            if self._oldest is None:
+                self._oldest = monotonic()
+                self._arm_timer()
+            if self.metrics is not None:
+                self.metrics.gauge('log_batcher.depth', len(self._entries))
+            if len(self._entries) >= self.batch_size \
+                    or self._payload_size >= self.max_payload_size \
+                    or monotonic() - self._oldest >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        """
+        Send everything that is buffered
+        :return: None
+        """
+        with self._lock:
+            self._flush()
+
+    def _arm_timer(self):
+        timer = threading.Timer(self.flush_interval, self._flush_expired)
+        timer.name = 'rp-log-batcher'
+        # The last batch is flushed by the service on terminate, the timer must not keep the interpreter alive
+        timer.daemon = True
+        self._timer = timer
+        timer.start()
+
+    def _flush_expired(self):
+        with self._lock:
+            if self._timer is not threading.current_thread():
+                # The batch the timer was armed for was already sent
+                return
+            self._timer = None
+            try:
+                self._flush()
+            except Exception:
+                logger.exception("Failed to send the expired batch of log entries")
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._entries:
+            return
+        entries = self._entries
+        self._entries = []
+        self._payload_size = 0
+        self._oldest = None
+        try:
+            self.send_batch(entries)
+        finally:
+            for entry in entries:
+                _close_attachment(entry.get('attachment'))
+        logger.debug("Sent a batch of %s log entries", len(entries))
+
+
+def _attachment_size(attachment):
+    if not attachment:
+        return 0
+    data = attachment.get('data')
+    if isinstance(data, (bytes, str)):
+        return len(data)
+    try:
+        return os.fstat(data.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+
+def _close_attachment(attachment):
+    if attachment and hasattr(attachment.get('data'), 'close'):
+        attachment['data'].close()
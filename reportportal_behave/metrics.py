@@ -0,0 +1,111 @@
+import functools
+import json
+import threading
+from collections import Counter
+from time import perf_counter
+
+
+class ClientMetrics:
+    """
+    Low overhead accumulator of what the reporting costs: time spent by call type, counters and gauges
+    """
+
+    def __init__(self):
+        self._timings = {}
+        self._counters = Counter()
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, duration):
+        """
+        Add the duration of a call
+        :param name: the call type, e.g. hook.after_step or rp.log
+        :param duration: the duration in seconds
+        :return: None
+        """
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                self._timings[name] = [1, duration, duration]
+            else:
+                timing[0] += 1
+                timing[1] += duration
+                if duration > timing[2]:
+                    timing[2] = duration
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def gauge(self, name, value):
+        """
+        Record the current value of a level, e.g. a queue depth; the last and the maximum values are kept
+        """
+        with self._lock:
+            last, maximum = self._gauges.get(name, (value, value))
+            self._gauges[name] = (value, max(maximum, value))
+
+    def summary(self):
+        """
+        :return: dict with the timings, counters and gauges collected so far
+        """
+        with self._lock:
+            return {
+                'timings': {name: {'count': count,
+                                   'total_ms': round(total * 1000, 3),
+                                   'mean_ms': round(total / count * 1000, 3),
+                                   'max_ms': round(maximum * 1000, 3)}
+                            for name, (count, total, maximum) in sorted(self._timings.items())},
+                'counters': dict(sorted(self._counters.items())),
+                'gauges': {name: {'last': last, 'max': maximum}
+                           for name, (last, maximum) in sorted(self._gauges.items())},
+            }
+
+    def as_attributes(self):
+        """
+        :return: a compact dict of the headline numbers, to label the launch with
+        """
+        with self._lock:
+            hooks_time = sum(total for name, (count, total, maximum) in self._timings.items()
+                             if name.startswith('hook.'))
+            requests_time = sum(total for name, (count, total, maximum) in self._timings.items()
+                                if name.startswith('rp.'))
+            return {
+                'rp_hooks_ms': int(hooks_time * 1000),
+                'rp_requests_ms': int(requests_time * 1000),
+                'rp_requests': self._counters['requests'],
+                'rp_request_bytes': self._counters['request_bytes'],
+                'rp_errors': self._counters['errors'],
+                'rp_dropped_logs': self._counters['queue.dropped_logs'],
+            }
+
+    def write_json(self, path):
+        with open(path, 'w') as metrics_file:
+            json.dump(self.summary(), metrics_file, indent=2)
+
+    def count_response(self, response, *args, **kwargs):
+        """
+        requests response hook counting the requests sent and their size
+        """
+        body = response.request.body
+        self.increment('requests')
+        self.increment('request_bytes', len(body) if body else 0)
+        self.increment('response_bytes', len(response.content))
+
+
+def timed_hook(hook):
+    """
+    Decorator recording the time spent in a BehaveIntegrationService hook, when metrics are enabled
+    """
+
+    @functools.wraps(hook)
+    def wrapper(self, *args, **kwargs):
+        if self.metrics is None:
+            return hook(self, *args, **kwargs)
+        started = perf_counter()
+        try:
+            return hook(self, *args, **kwargs)
+        finally:
+            self.metrics.record(f"hook.{hook.__name__}", perf_counter() - started)
+
+    return wrapper
@@ -0,0 +1,77 @@
+import gzip
+import itertools
+import re
+import tempfile
+
+# Compressed attachments stay in memory up to this size and are moved to a temporary file past it
+_SPOOL_SIZE = 1024 * 1024
+
+
+class PayloadPolicy:
+    """
+    Keeps log messages and descriptions to a bounded size.
+    Content is consumed as a stream of string chunks; as long as it fits max_message_size it is logged inline,
+    past that the message keeps a preview and the full content is gzipped into an attachment.
+    """
+
+    def __init__(self, max_message_size=64 * 1024, preview_size=4 * 1024, attach_oversized=True):
+        """
+        :param max_message_size: the maximum number of characters logged inline, None disables the limit
+        :param preview_size: the number of characters kept in the message when the content is too large
+        :param attach_oversized: attach the full content of truncated messages as a gzip file
+        """
+        self.max_message_size = max_message_size
+        self.preview_size = preview_size
+        self.attach_oversized = attach_oversized
+
+    def render(self, name, content, attach=None):
+        """
+        Render content to a log message, truncating it if needed
+        :param name: the name the attachment is derived from
+        :param content: a string or an iterable of string chunks
+        :param attach: override attach_oversized, e.g. for item descriptions that cannot have attachments
+        :return: tuple of the message and the attachment holding the full content, or None if it was not needed
+        """
+        if isinstance(content, str):
+            content = (content,)
+        if self.max_message_size is None:
+            return ''.join(content), None
+
+        chunks = iter(content)
+        head = []
+        size = 0
+        for chunk in chunks:
+            head.append(chunk)
+            size += len(chunk)
+            if size > self.max_message_size:
+                break
+        else:
+            return ''.join(head), None
+
+        preview = ''.join(head)[:self.preview_size]
+        if not (self.attach_oversized if attach is None else attach):
+            return f"{preview}\n... truncated, the content is longer than {self.max_message_size} characters", None
+
+        filename = f"{_safe_name(name)}.txt.gz"
+        data = tempfile.SpooledTemporaryFile(max_size=_SPOOL_SIZE)
+        total = 0
+        with gzip.GzipFile(filename=filename[:-3], fileobj=data, mode='wb', compresslevel=6) as archive:
+            for chunk in itertools.chain(head, chunks):
+                archive.write(chunk.encode('utf-8'))
+                total += len(chunk)
+        data.seek(0)
+        message = f"{preview}\n... truncated to {len(preview)} of {total} characters, " \
+                  f"the full content is attached as {filename}"
+        return message, {'name': filename, 'data': data, 'mime': 'application/gzip'}
+
+
+def iter_chunks(text, chunk_size=64 * 1024):
+    """
+    Split a long string in chunks without copying it all at once
+    """
+    for start in range(0, len(text), chunk_size):
+        yield text[start:start + chunk_size]
+
+
+def _safe_name(name):
+    return re.sub(r'[^\w.-]+', '_', name or 'content').strip('_')[:100] or 'content'
@@ -0,0 +1,179 @@
+import functools
+import heapq
+import itertools
+import json
+from array import array
+from collections import Counter
+from time import monotonic
+
+
+class RunProfiler:
+    """
+    Accumulates the durations of the features, scenarios and steps of a run on the monotonic clock.
+    Step durations are kept per keyword type and step definition pattern, so that the percentiles of every definition
+    can be computed at the end; only the slowest steps and scenarios are kept by name.
+    """
+
+    def __init__(self, top=10):
+        """
+        :param top: the number of slowest steps, scenarios and step definitions reported
+        """
+        self.top = top
+        self.totals = Counter()
+        self.last = {}
+        self._started = {}
+        self._definitions = {}
+        self._patterns = {}
+        self._slowest = {'step': [], 'scenario': []}
+        self._sequence = itertools.count()
+
+    def start(self, level):
+        self._started[level] = monotonic()
+
+    def finish(self, level, model=None):
+        """
+        Record the duration of the feature, scenario or step that just ended
+        :param level: one of run, feature, scenario or step
+        :param model: the behave feature, scenario or step
+        :return: the duration in seconds, or None if its start was not recorded
+        """
+        started = self._started.pop(level, None)
+        self.last.pop(level, None)
+        if started is None:
+            return None
+        duration = monotonic() - started
+        self.totals[level] += duration
+        self.last[level] = duration
+        if level == 'step':
+            self._definitions.setdefault(self._definition(model), array('d')).append(duration)
+        if level in self._slowest:
+            slowest = self._slowest[level]
+            entry = (duration, next(self._sequence), f"{_label(level, model)} ({model.location})")
+            if len(slowest) < self.top:
+                heapq.heappush(slowest, entry)
+            elif duration > slowest[0][0]:
+                heapq.heapreplace(slowest, entry)
+        return duration
+
+    def _definition(self, step):
+        """
+        :return: the keyword type and the pattern of the step definition matching the step, its text if undefined
+        """
+        key = (step.step_type, step.name)
+        definition = self._patterns.get(key)
+        if definition is None:
+            # The match found by behave is not kept on the step, steps with the same text share the lookup
+            step_definition = _find_step_definition(step)
+            definition = f"{step.step_type} {step_definition.pattern if step_definition else step.name}"
+            self._patterns[key] = definition
+        return definition
+
+    def definition_stats(self):
+        """
+        :return: list of the statistics of every step definition, the largest total time first
+        """
+        stats = []
+        for definition, durations in self._definitions.items():
+            ordered = sorted(durations)
+            stats.append({'definition': definition,
+                          'count': len(ordered),
+                          'total_ms': _ms(sum(ordered)),
+                          'mean_ms': _ms(sum(ordered) / len(ordered)),
+                          'p50_ms': _ms(_percentile(ordered, 0.5)),
+                          'p90_ms': _ms(_percentile(ordered, 0.9)),
+                          'p95_ms': _ms(_percentile(ordered, 0.95)),
+                          'max_ms': _ms(ordered[-1])})
+        stats.sort(key=lambda stat: stat['total_ms'], reverse=True)
+        return stats
+
+    def breakdown(self, reporting_time=None):
+        """
+        :param reporting_time: the seconds spent in the reporting hooks, if known
+        :return: dict of where the time of the run went, in milliseconds
+        """
+        breakdown = {'run_ms': _ms(self.totals['run']),
+                     'features_ms': _ms(self.totals['feature']),
+                     'scenarios_ms': _ms(self.totals['scenario']),
+                     'steps_ms': _ms(self.totals['step']),
+                     'outside_steps_ms': _ms(self.totals['scenario'] - self.totals['step']),
+                     'outside_scenarios_ms': _ms(self.totals['feature'] - self.totals['scenario']),
+                     'outside_features_ms': _ms(self.totals['run'] - self.totals['feature'])}
+        if reporting_time is not None:
+            breakdown['reporting_ms'] = _ms(reporting_time)
+        return breakdown
+
+    def slowest(self, level):
+        """
+        :return: list of (duration in milliseconds, label) of the slowest steps or scenarios, the slowest first
+        """
+        return [(_ms(duration), label) for duration, sequence, label in sorted(self._slowest[level], reverse=True)]
+
+    def report(self, reporting_time=None):
+        """
+        Render the profile of the run
+        :param reporting_time: the seconds spent in the reporting hooks, if known
+        :return: tuple of the text summary and the full profile as JSON bytes
+        """
+        breakdown = self.breakdown(reporting_time)
+        definitions = self.definition_stats()
+        lines = ["Time breakdown:"]
+        lines.extend(f"  {name[:-3].replace('_', ' ')}: {value / 1000:.3f}s" for name, value in breakdown.items())
+        for level in ('step', 'scenario'):
+            lines.append(f"\nSlowest {level}s:")
+            lines.extend(f"  {duration / 1000:.3f}s {label}" for duration, label in self.slowest(level))
+        lines.append("\nStep definitions by total time (count, total, mean, p50, p90, p95, max):")
+        lines.extend(f"  {stat['count']} {stat['total_ms'] / 1000:.3f}s {stat['mean_ms']}ms {stat['p50_ms']}ms "
+                     f"{stat['p90_ms']}ms {stat['p95_ms']}ms {stat['max_ms']}ms {stat['definition']}"
+                     for stat in definitions[:self.top])
+        profile = {'breakdown': breakdown,
+                   'slowest_steps': self.slowest('step'),
+                   'slowest_scenarios': self.slowest('scenario'),
+                   'step_definitions': definitions}
+        return '\n'.join(lines), json.dumps(profile, indent=1).encode('utf-8')
+
+
+def profiled_hook(level):
+    """
+    Time the feature, scenario or step from the end of its before hook to the start of its after hook, so that the
+    time spent reporting it is left out. The decorated hooks take the behave model as first argument.
+    """
+    def decorator(hook):
+        is_before = hook.__name__.startswith('before_')
+
+        @functools.wraps(hook)
+        def wrapper(self, model, *args, **kwargs):
+            if self.profiler is None:
+                return hook(self, model, *args, **kwargs)
+            if is_before:
+                try:
+                    return hook(self, model, *args, **kwargs)
+                finally:
+                    self.profiler.start(level)
+            self.profiler.finish(level, model)
+            return hook(self, model, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _find_step_definition(step):
+    from behave import runner, step_registry
+    # behave replaces behave.step_registry.registry before a run, while the runner keeps the registry it imported
+    for registry in (getattr(runner, 'the_step_registry', None), step_registry.registry):
+        step_definition = registry.find_step_definition(step) if registry is not None else None
+        if step_definition is not None:
+            return step_definition
+    return None
+
+
+def _label(level, model):
+    if level == 'step':
+        return f"{model.keyword} {model.name}"
+    return model.name
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
@@ -0,0 +1,262 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+from time import monotonic
+
+from reportportal_behave.journal import ID_ARGUMENTS, load_attachment, read_events
+from reportportal_behave.reportportal_service import IntegrationService, reportportal_error_handler
+
+logger = logging.getLogger(__name__)
+
+
+class JournalReplayer:
+    """
+    Sends the events of a journal written by the SpoolingIntegrationService to ReportPortal.
+    Item starts and finishes are sent in order, logs are grouped in batches uploaded concurrently.
+    Progress is recorded in an acknowledgement file so an interrupted replay resumes where it stopped.
+    """
+
+    def __init__(self, service, ack_path, workers=8, log_batch_size=20, stop_on_error=True):
+        """
+        :param service: the IntegrationService used to send the events
+        :param ack_path: the file recording the acknowledged events and the ids created on ReportPortal, None to not
+                         record them
+        :param workers: the number of log batches uploaded at the same time
+        :param log_batch_size: the maximum number of logs in a batch
+        :param stop_on_error: stop at the first event that could not be sent, so that the replay can be resumed;
+                              otherwise the event is skipped, with the items depending on it
+        """
+        self.service = service
+        self.ack_path = ack_path
+        self.workers = workers
+        self.log_batch_size = log_batch_size
+        self.stop_on_error = stop_on_error
+        self.sent_events = 0
+        self.failed = False
+        self._item_ids = {}
+        self._sent_offsets = set()
+        self._in_flight = {}
+        self._lock = Lock()
+        self._ack_lock = Lock()
+        self._ack_file = None
+
+    def replay(self, journal_path):
+        """
+        Send every event of the journal that was not acknowledged yet
+        :param journal_path: the path of the journal
+        :return: True if all the events were sent
+        """
+        offset = self._load_acks()
+        with open(self.ack_path, 'a') as self._ack_file:
+            return self.send_events(read_events(journal_path, offset))
+
+    def send_events(self, events):
+        """
+        Send events, the item starts and finishes in order and the logs in batches uploaded concurrently
+        :param events: iterable of (event, offset of the next event) tuples; a None item sends the logs collected
+                       so far without waiting for the batch to fill up
+        :return: True if all the events were sent
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            batches = set()
+
+            def submit(logs):
+                batch = executor.submit(self._send_logs, logs)
+                batches.add(batch)
+                batch.add_done_callback(batches.discard)
+
+            logs = []
+            for index, item in enumerate(events):
+                if self.failed:
+                    break
+                if item is None:
+                    if logs:
+                        submit(logs)
+                        logs = []
+                    continue
+                event, next_offset = item
+                with self._lock:
+                    self._in_flight[index] = [next_offset, False]
+                if next_offset is not None and next_offset in self._sent_offsets:
+                    # Sent by the interrupted replay after an event that was still in flight
+                    self._acknowledge([index])
+                    continue
+                if event['m'] == 'log_step_result':
+                    logs.append((index, event))
+                    if len(logs) >= self.log_batch_size:
+                        submit(logs)
+                        logs = []
+                    continue
+                if logs:
+                    submit(logs)
+                    logs = []
+                if event['m'] == 'finish_launcher':
+                    # The logs still being uploaded must reach the launch before it is finished
+                    wait(set(batches))
+                    if self.failed:
+                        break
+                self._send(index, event)
+            if logs and not self.failed:
+                submit(logs)
+        return not self.failed
+
+    def _send(self, index, event):
+        if event.get('id') in self._item_ids:
+            # Created by the interrupted replay
+            self._acknowledge([index])
+            return
+        try:
+            kwargs = self._resolve(event['kw'])
+            if kwargs is None:
+                logger.warning("Skipping %s because its parent item could not be created", event['m'])
+                result = None
+            else:
+                result = getattr(self._service(event), event['m'])(**kwargs)
+            if 'id' in event:
+                self._item_ids[event['id']] = result
+                self._write_ack({'id': event['id'],
+                                 'real': result,
+                                 'launch': event['m'] in ('start_launcher', 'rerun_launcher')})
+            self._acknowledge([index])
+        except Exception:
+            reportportal_error_handler(sys.exc_info())
+            if self.stop_on_error:
+                self.failed = True
+                return
+            if 'id' in event:
+                self._item_ids[event['id']] = None
+            self._acknowledge([index])
+
+    def _send_logs(self, logs):
+        try:
+            batches = {}
+            for index, event in logs:
+                kwargs = self._resolve(event['kw'])
+                if kwargs is None:
+                    continue
+                if kwargs.get('attachment'):
+                    kwargs['attachment'] = load_attachment(kwargs['attachment'])
+                batches.setdefault(self._service(event), []).append(kwargs)
+            for service, batch in batches.items():
+                service.log_batch(batch)
+            self._acknowledge([index for index, event in logs])
+        except Exception:
+            reportportal_error_handler(sys.exc_info())
+            if self.stop_on_error:
+                self.failed = True
+            else:
+                self._acknowledge([index for index, event in logs])
+
+    def _service(self, event):
+        """
+        :return: the IntegrationService sending the event
+        """
+        return self.service
+
+    def _resolve(self, kwargs):
+        resolved = dict(kwargs)
+        for argument in ID_ARGUMENTS:
+            value = resolved.get(argument)
+            if value in self._item_ids:
+                resolved[argument] = self._item_ids[value]
+                if resolved[argument] is None:
+                    return None
+        return resolved
+
+    def _acknowledge(self, indexes):
+        """
+        Mark events as sent and move the resume point past every event sent so far without gaps. The events sent
+        after a gap are recorded one by one, so that a resumed replay does not send them again.
+        """
+        with self._lock:
+            self.sent_events += len(indexes)
+            for index in indexes:
+                self._in_flight[index][1] = True
+            offset = None
+            while self._in_flight:
+                first = next(iter(self._in_flight))
+                next_offset, is_sent = self._in_flight[first]
+                if not is_sent:
+                    break
+                offset = next_offset
+                del self._in_flight[first]
+            if offset is not None:
+                self._write_ack({'offset': offset})
+            for index in indexes:
+                next_offset = self._in_flight[index][0] if index in self._in_flight else None
+                if next_offset is not None and next_offset not in self._sent_offsets:
+                    self._write_ack({'sent': next_offset})
+
+    def _write_ack(self, ack):
+        if self._ack_file is None:
+            return
+        with self._ack_lock:
+            self._ack_file.write(json.dumps(ack, separators=(',', ':')) + '\n')
+            self._ack_file.flush()
+
+    def _load_acks(self):
+        offset = 0
+        if not os.path.exists(self.ack_path):
+            return offset
+        with open(self.ack_path) as ack_file:
+            for line in ack_file:
+                if not line.endswith('\n'):
+                    break
+                ack = json.loads(line)
+                if 'offset' in ack:
+                    offset = ack['offset']
+                elif 'sent' in ack:
+                    self._sent_offsets.add(ack['sent'])
+                else:
+                    self._item_ids[ack['id']] = ack['real']
+                    if ack['launch'] and ack['real']:
+                        # The launch was started by the interrupted replay, report into it again
+                        self.service.join_launcher(launch_id=ack['real'])
+        logger.info("Resuming replay at byte %s", offset)
+        return offset
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Send a journal written in spool mode to ReportPortal')
+    parser.add_argument('journal', help='path of the journal')
+    parser.add_argument('--endpoint', default=os.environ.get('RP_ENDPOINT'), help='ReportPortal URL')
+    parser.add_argument('--project', default=os.environ.get('RP_PROJECT'), help='ReportPortal project')
+    parser.add_argument('--token', default=os.environ.get('RP_TOKEN'), help='ReportPortal token')
+    parser.add_argument('--verify-ssl', action='store_true', help='verify the SSL certificate of ReportPortal')
+    parser.add_argument('--workers', type=int, default=8, help='number of concurrent log uploads')
+    parser.add_argument('--log-batch-size', type=int, default=20, help='maximum number of logs per request')
+    parser.add_argument('--ack-file', help='acknowledgement file, <journal>.ack by default')
+    args = parser.parse_args(argv)
+    if not (args.endpoint and args.project and args.token):
+        parser.error('--endpoint, --project and --token (or RP_ENDPOINT, RP_PROJECT and RP_TOKEN) are required')
+    logging.basicConfig(level=logging.INFO)
+
+    service = IntegrationService(rp_endpoint=args.endpoint,
+                                 rp_project=args.project,
+                                 rp_token=args.token,
+                                 rp_launch_name=None,
+                                 rp_launch_description=None,
+                                 verify_ssl=args.verify_ssl,
+                                 transport_options={'pool_size': args.workers, 'max_concurrency': args.workers})
+    replayer = JournalReplayer(service,
+                               ack_path=args.ack_file or f"{args.journal}.ack",
+                               workers=args.workers,
+                               log_batch_size=args.log_batch_size)
+    started = monotonic()
+    succeeded = replayer.replay(args.journal)
+    service.terminate_service()
+    elapsed = monotonic() - started
+    logger.info("Sent %s events in %.1fs (%.0f events/s)",
+                replayer.sent_events, elapsed, replayer.sent_events / elapsed if elapsed else 0)
+    if not succeeded:
+        logger.error("The replay stopped on an error, run the command again to resume it")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+import random
+
+REPORTING_POLICIES = ('full', 'failures')
+
+
+class StepRecord:
+    __slots__ = ('step', 'attributes', 'start_time', 'end_time', 'screenshots')
+
+    def __init__(self, step, start_time, attributes=None):
+        self.step = step
+        self.attributes = attributes
+        self.start_time = start_time
+        self.end_time = None
+        self.screenshots = []
+
+
+class ScenarioStepBuffer:
+    """
+    Holds the steps of the running scenario until it is known whether they are worth reporting in full:
+    failed scenarios, and a sampled share of the passed ones, get every step; the others a single summary log.
+    """
+
+    def __init__(self, passed_sample_rate=0.0, seed=None):
+        """
+        :param passed_sample_rate: share of the passed scenarios still reported in full, between 0 and 1
+        :param seed: seed of the random generator used for the sampling
+        """
+        self.passed_sample_rate = passed_sample_rate
+        self.records = []
+        self._random = random.Random(seed)
+        self._current = None
+
+    def start_step(self, step, start_time, attributes=None):
+        self._current = StepRecord(step, start_time, attributes)
+
+    def finish_step(self, step, end_time):
+        """
+        Record the result of a step
+        :param step: the behave step
+        :param end_time: the time the step finished
+        :return: the StepRecord of the step
+        """
+        record = self._current
+        if record is None or record.step is not step:
+            # before_step was not called for this step
+            record = StepRecord(step, end_time)
+        record.end_time = end_time
+        self.records.append(record)
+        self._current = None
+        return record
+
+    def report_in_full(self, scenario):
+        if scenario.status == 'failed' or any(record.step.status == 'failed' for record in self.records):
+            return True
+        return self.passed_sample_rate > 0 and self._random.random() < self.passed_sample_rate
+
+    def summary(self):
+        """
+        :return: generator of the lines of the summary log of the buffered steps
+        """
+        yield f"{len(self.records)} steps passed, only this summary was reported:"
+        for record in self.records:
+            duration = (int(record.end_time) - int(record.start_time)) / 1000
+            yield f"\n{record.step.keyword} {record.step.name} - {record.step.status.name} in {duration:.3f}s"
+
+    def clear(self):
+        self.records = []
+        self._current = None
@@ -0,0 +1,249 @@
+import logging
+import pickle
+import queue
+import sys
+import tempfile
+import threading
+import uuid
+
+from reportportal_behave.reportportal_service import reportportal_error_handler
+
+logger = logging.getLogger(__name__)
+
+BACKPRESSURE_POLICIES = ('block', 'drop_logs', 'spill')
+
+_ID_ARGUMENTS = ('item_id', 'parent_item_id')
+_STOP = object()
+
+
+class QueuedIntegrationService:
+    """
+    Wraps an IntegrationService and sends everything but the launch start/finish from a background worker.
+    Item starts return placeholder ids right away; the worker maps them to the real ids as the responses arrive.
+    Events are sent in submission order, so parents are always created before their children.
+    """
+
+    def __init__(self, service, max_queue_size=1000, backpressure='block', metrics=None):
+        """
+        :param service: the IntegrationService that actually talks to ReportPortal
+        :param max_queue_size: the maximum number of events waiting to be sent
+        :param backpressure: what to do when the queue is full:
+                             block - wait for the worker to free a slot
+                             drop_logs - drop log events, block for everything else
+                             spill - write the overflow to a temporary file on disk
+        :param metrics: the ClientMetrics recording the queue depth and the dropped logs
+        """
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"backpressure must be one of {BACKPRESSURE_POLICIES}, got {backpressure!r}")
+        self.service = service
+        self.backpressure = backpressure
+        self.metrics = metrics
+        self.dropped_logs = 0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._item_ids = {}
+        self._pending = 0
+        self._pending_condition = threading.Condition()
+        self._spill_lock = threading.Lock()
+        self._spill_file = None
+        self._spill_offset = 0
+        self._spilling = False
+        self._worker = threading.Thread(target=self._run, name='rp-reporting-queue', daemon=True)
+        self._worker.start()
+
+    @property
+    def depth(self):
+        return self._pending
+
+    def start_launcher(self, **kwargs):
+        # The launch id is needed by the caller straight away, so the launch is started synchronously
+        return self.service.start_launcher(**kwargs)
+
+    def rerun_launcher(self, **kwargs):
+        return self.service.rerun_launcher(**kwargs)
+
+    def join_launcher(self, **kwargs):
+        return self.service.join_launcher(**kwargs)
+
+    def start_feature_test(self, **kwargs):
+        return self._submit_start('start_feature_test', kwargs)
+
+    def start_scenario_test(self, **kwargs):
+        return self._submit_start('start_scenario_test', kwargs)
+
+    def start_step_test(self, **kwargs):
+        return self._submit_start('start_step_test', kwargs)
+
+    def report_skipped_scenarios(self, **kwargs):
+        self._submit('report_skipped_scenarios', kwargs)
+
+    def finish_step_test(self, **kwargs):
+        self._submit('finish_step_test', kwargs)
+
+    def finish_scenario_test(self, **kwargs):
+        self._submit('finish_scenario_test', kwargs)
+
+    def finish_feature(self, **kwargs):
+        self._submit('finish_feature', kwargs)
+
+    def log_step_result(self, **kwargs):
+        self._submit('log_step_result', kwargs, is_log=True)
+
+    def flush_logs(self):
+        self._submit('flush_logs', {})
+
+    def finish_launcher(self, **kwargs):
+        self.drain()
+        return self.service.finish_launcher(**kwargs)
+
+    def terminate_service(self):
+        self.drain()
+        self._queue.put(_STOP)
+        self._worker.join()
+        if self._spill_file is not None:
+            self._spill_file.close()
+        self.service.terminate_service()
+
+    def drain(self):
+        """
+        Block until every submitted event was sent to ReportPortal
+        :return: None
+        """
+        with self._pending_condition:
+            while self._pending:
+                self._pending_condition.wait()
+        # The wrapped service may still buffer logs or have requests in flight
+        self.service.drain()
+
+    def resolve_id(self, item_id):
+        """
+        Translate a placeholder id into the id returned by ReportPortal, waiting for it if needed
+        :param item_id: a placeholder id returned by one of the start methods
+        :return: the ReportPortal id, or None if the item could not be created
+        """
+        if item_id not in self._item_ids and self._is_placeholder(item_id):
+            self.drain()
+        item_id = self._item_ids.get(item_id, item_id)
+        if item_id is not None and hasattr(self.service, 'resolve_id'):
+            # The wrapped service may hand out placeholder ids of its own
+            return self.service.resolve_id(item_id)
+        return item_id
+
+    def _submit_start(self, method, kwargs):
+        placeholder = f"pending-{uuid.uuid4()}"
+        self._submit(method, kwargs, placeholder=placeholder)
+        return placeholder
+
+    def _submit(self, method, kwargs, placeholder=None, is_log=False):
+        event = (method, kwargs, placeholder)
+        with self._pending_condition:
+            self._pending += 1
+        if self.metrics is not None:
+            self.metrics.gauge('queue.depth', self._pending)
+        if self.backpressure == 'spill':
+            with self._spill_lock:
+                if not self._spilling:
+                    try:
+                        self._queue.put_nowait(event)
+                        return
+                    except queue.Full:
+                        logger.debug("Reporting queue is full, spilling events to disk")
+                        self._spilling = True
+                self._spill(event)
+        elif self.backpressure == 'drop_logs' and is_log:
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                self.dropped_logs += 1
+                if self.metrics is not None:
+                    self.metrics.increment('queue.dropped_logs')
+                self._mark_done()
+        else:
+            self._queue.put(event)
+
+    def _spill(self, event):
+        method, kwargs, placeholder = event
+        attachment = kwargs.get('attachment')
+        if attachment and hasattr(attachment.get('data'), 'read'):
+            # File handles cannot be pickled, keep the content instead
+            file_handle = attachment['data']
+            kwargs = dict(kwargs, attachment=dict(attachment, data=file_handle.read()))
+            file_handle.close()
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile(prefix='rp-spill-')
+        self._spill_file.seek(0, 2)
+        pickle.dump((method, kwargs, placeholder), self._spill_file)
+
+    def _unspill(self):
+        """
+        Read the next spilled event off the disk, or leave spill mode if every spilled event was read
+        :return: the oldest spilled event not read yet, None if there is none left
+        """
+        with self._spill_lock:
+            if self._spill_file is not None:
+                self._spill_file.seek(self._spill_offset)
+                try:
+                    event = pickle.load(self._spill_file)
+                except EOFError:
+                    pass
+                else:
+                    self._spill_offset = self._spill_file.tell()
+                    return event
+                # Nothing can be spilled while the file is emptied, the lock is held
+                self._spill_file.seek(0)
+                self._spill_file.truncate()
+                self._spill_offset = 0
+            self._spilling = False
+            return None
+
+    def _run(self):
+        while True:
+            try:
+                event = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                while self._spilling:
+                    # One event at a time, so that a long spill never has to fit in memory
+                    spilled_event = self._unspill()
+                    if spilled_event is not None:
+                        self._send(spilled_event)
+                continue
+            if event is _STOP:
+                return
+            self._send(event)
+
+    def _send(self, event):
+        method, kwargs, placeholder = event
+        try:
+            kwargs = self._resolve(kwargs)
+            if kwargs is None:
+                logger.warning("Skipping %s because its parent item could not be created", method)
+                result = None
+            else:
+                result = getattr(self.service, method)(**kwargs)
+            if placeholder is not None:
+                self._item_ids[placeholder] = result
+        except Exception:
+            if placeholder is not None:
+                self._item_ids[placeholder] = None
+            reportportal_error_handler(sys.exc_info(), self.metrics)
+        finally:
+            self._mark_done()
+
+    def _resolve(self, kwargs):
+        resolved = dict(kwargs)
+        for argument in _ID_ARGUMENTS:
+            value = resolved.get(argument)
+            if self._is_placeholder(value):
+                resolved[argument] = self._item_ids.get(value)
+                if resolved[argument] is None:
+                    return None
+        return resolved
+
+    def _mark_done(self):
+        with self._pending_condition:
+            self._pending -= 1
+            if not self._pending:
+                self._pending_condition.notify_all()
+
+    @staticmethod
+    def _is_placeholder(item_id):
+        return isinstance(item_id, str) and item_id.startswith('pending-')
@@ -1,19 +1,26 @@
 import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, time
 
-from reportportal_client import ReportPortalService
-from time import time
+from reportportal_behave.log_batcher import LogBatcher
 
 logger = logging.getLogger(__name__)
 
+TRANSPORT_BACKENDS = ('client', 'asyncio')
 
-def reportportal_error_handler(exc_info):
+
+def reportportal_error_handler(exc_info, metrics=None):
     """
     This callback function will be called by async service client when error occurs.
     Return True if error is not critical and you want to continue work.
     :param exc_info: result of sys.exc_info() -> (type, value, traceback)
+    :param metrics: the ClientMetrics counting the reported errors
     :return:
     """
-    logger.error(*exc_info, exc_info=True)
+    if metrics is not None:
+        metrics.increment('reported_errors')
+    logger.error("ReportPortal request failed: %s", exc_info[1], exc_info=exc_info)
 
 
 def timestamp():
@@ -22,23 +29,84 @@ def timestamp():
 
 class IntegrationService:
 
-    def __init__(self, rp_endpoint, rp_project, rp_token, rp_launch_name, rp_launch_description, verify_ssl=False):
+    def __init__(self, rp_endpoint, rp_project, rp_token, rp_launch_name, rp_launch_description, verify_ssl=False,
+                 log_batch_size=1, log_batch_payload_size=10 * 1024 * 1024, log_flush_interval=5,
+                 transport_options=None, metrics=None, backend='client', backend_concurrency=8, session=None):
+        if backend not in TRANSPORT_BACKENDS:
+            raise ValueError(f"backend must be one of {TRANSPORT_BACKENDS}, got {backend!r}")
         self.rp_endpoint = rp_endpoint
         self.rp_project = rp_project
         self.rp_token = rp_token
         self.rp_launch_name = rp_launch_name
         self.rp_launch_description = rp_launch_description
-        self.rp_async_service = ReportPortalService(endpoint=self.rp_endpoint,
-                                                    project=self.rp_project,
-                                                    token=self.rp_token,
-                                                    verify_ssl=verify_ssl)
+        # Imported here so that runs with the reporting disabled never pay for importing the client
+        if backend == 'asyncio':
+            from reportportal_behave.backends.asyncio_backend import AsyncioBackend
+            self.backend = AsyncioBackend(endpoint=self.rp_endpoint,
+                                          project=self.rp_project,
+                                          token=self.rp_token,
+                                          verify_ssl=verify_ssl,
+                                          session=session,
+                                          max_concurrency=backend_concurrency,
+                                          metrics=metrics)
+        else:
+            from reportportal_behave.backends.client_backend import ClientBackend
+            self.backend = ClientBackend(endpoint=self.rp_endpoint,
+                                         project=self.rp_project,
+                                         token=self.rp_token,
+                                         verify_ssl=verify_ssl,
+                                         session=session)
+        self.rp_async_service = self.backend.client
+        if transport_options is not None and session is None:
+            # A shared session was configured by its owner
+            from reportportal_behave.http_transport import configure_session
+            configure_session(self.backend.session, **transport_options)
+        self.metrics = metrics
+        # Created with the first feature that has several @skip scenarios and kept for the next ones
+        self._skipped_executor = None
+        if metrics is not None and session is None:
+            self.backend.session.hooks['response'].append(metrics.count_response)
+        self.log_batcher = None
+        if log_batch_size > 1:
+            self.log_batcher = LogBatcher(self._send_log_batch,
+                                          metrics=metrics,
+                                          batch_size=log_batch_size,
+                                          max_payload_size=log_batch_payload_size,
+                                          flush_interval=log_flush_interval)
 
     def start_launcher(self, name, start_time, description=None, attributes=None, tags=None):
-        return self.rp_async_service.start_launch(name=name,
-                                                  start_time=start_time,
-                                                  description=description,
-                                                  attributes=attributes,
-                                                  tags=tags)
+        return self._call('start_launch',
+                          self.backend.start_launch,
+                          name=name,
+                          start_time=start_time,
+                          description=description,
+                          attributes=attributes)
+
+    def rerun_launcher(self, launch_id, name, start_time, description=None, attributes=None):
+        """
+        Reopen a finished launch to report a rerun into it
+        :param launch_id: the id of the launch to rerun
+        :param name: the name of the launch
+        :param start_time: the start time of the rerun
+        :param description: the description of the launch
+        :param attributes: the attributes to label the launch with
+        :return: the id of the launch
+        """
+        return self._call('start_launch',
+                          self.backend.rerun_launch,
+                          launch_id=launch_id,
+                          name=name,
+                          start_time=start_time,
+                          description=description,
+                          attributes=attributes)
+
+    def join_launcher(self, launch_id):
+        """
+        Report into a launch started by someone else
+        :param launch_id: the id of the existing launch
+        :return: None
+        """
+        self.backend.join_launch(launch_id)
 
     def start_feature_test(self, **kwargs):
         return self._start_test(**kwargs)
@@ -49,55 +117,216 @@ class IntegrationService:
     def start_step_test(self, **kwargs):
         return self._start_test(**kwargs)
 
+    def report_skipped_scenarios(self, scenarios, start_time, end_time, parent_item_id,
+                                 attributes=None, tags=None, max_workers=8):
+        """
+        Register scenarios that were not run as SKIPPED, sending them concurrently
+        :param scenarios: list of dicts with the name and description of every scenario
+        :param start_time: the start time of the scenarios
+        :param end_time: the end time of the scenarios
+        :param parent_item_id: the id of the feature the scenarios belong to
+        :param attributes: the attributes to label the scenarios with
+        :param tags: the tags of the scenarios
+        :param max_workers: the maximum number of scenarios sent at the same time, the first call sizes the thread pool
+        :return: the ids of the scenarios
+        """
+        def report(scenario):
+            item_id = self._start_test(name=scenario['name'],
+                                       description=scenario.get('description'),
+                                       attributes=attributes,
+                                       tags=tags,
+                                       start_time=start_time,
+                                       item_type='SCENARIO',
+                                       parent_item_id=parent_item_id)
+            self._finish_test(end_time=end_time, status='SKIPPED', item_id=item_id)
+            return item_id
+
+        if len(scenarios) == 1 or self.backend.concurrent:
+            return [report(scenario) for scenario in scenarios]
+        if self._skipped_executor is None:
+            self._skipped_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='rp-skipped')
+        return list(self._skipped_executor.map(report, scenarios))
+
     def finish_step_test(self, **kwargs):
         return self._finish_test(**kwargs)
 
     def finish_scenario_test(self, **kwargs):
+        self.flush_logs()
         return self._finish_test(**kwargs)
 
     def finish_feature(self, **kwargs):
+        self.flush_logs()
         return self._finish_test(**kwargs)
 
-    def finish_launcher(self, end_time, launch_id, status=None):
-        return self.rp_async_service.finish_launch(end_time=end_time, status=status, launch_id=launch_id)
+    def finish_launcher(self, end_time, launch_id, status=None, attributes=None):
+        self.flush_logs()
+        return self._call('finish_launch',
+                          self.backend.finish_launch,
+                          end_time=end_time,
+                          status=status,
+                          attributes=attributes)
 
     def log_step_result(self, end_time, message, level='INFO', attachment=None, item_id=None):
-        self.rp_async_service.log(time=end_time,
-                                  message=message,
-                                  level=level,
-                                  attachment=attachment,
-                                  item_id=item_id)
+        if self.log_batcher:
+            self.log_batcher.add(time=end_time,
+                                 message=message,
+                                 level=level,
+                                 attachment=attachment,
+                                 item_id=item_id)
+            return
+        try:
+            self._call('attachment' if attachment else 'log',
+                       self.backend.log,
+                       time=end_time,
+                       message=message,
+                       level=level,
+                       attachment=attachment,
+                       item_id=item_id)
+        except Exception:
+            reportportal_error_handler(sys.exc_info(), self.metrics)
+            entry = {'time': end_time, 'message': message, 'level': level, 'attachment': attachment}
+            if item_id:
+                entry['itemUuid'] = item_id
+            self._log_inline([entry])
+        finally:
+            if attachment and hasattr(attachment.get('data'), 'close'):
+                attachment['data'].close()
+
+    def log_batch(self, logs):
+        """
+        Send several logs in a single request
+        :param logs: list of dicts with the arguments of log_step_result
+        :return: the response of the batch request
+        """
+        entries = []
+        for log in logs:
+            entry = {'time': log['end_time'], 'message': log['message'], 'level': log.get('level', 'INFO')}
+            if log.get('item_id'):
+                entry['itemUuid'] = log['item_id']
+            if log.get('attachment'):
+                entry['attachment'] = log['attachment']
+            entries.append(entry)
+        return self._call('log_batch', self.backend.log_batch, entries)
+
+    def flush_logs(self):
+        if self.log_batcher:
+            self.log_batcher.flush()
+
+    def drain(self):
+        """
+        Block until everything reported so far was sent to ReportPortal, including the buffered logs
+        :return: None
+        """
+        self.flush_logs()
+        self.backend.drain()
+
+    def resolve_id(self, item_id):
+        """
+        Translate an id returned by one of the start methods into the id of the item in ReportPortal
+        :param item_id: the id returned by the start method
+        :return: the ReportPortal id, or None if the item could not be created
+        """
+        return self.backend.resolve_id(item_id)
 
     def terminate_service(self):
-        self.rp_async_service.terminate()
+        if self._skipped_executor is not None:
+            self._skipped_executor.shutdown()
+        self.flush_logs()
+        self.backend.terminate()
 
-    def _start_test(self, name, start_time, item_type, description=None, attributes=None, tags=None, parent_item_id=None):
+    def _start_test(self, name, start_time, item_type, description=None, attributes=None, tags=None,
+                    parent_item_id=None, retry=False):
         """
         item_type can be (SUITE, STORY, TEST, SCENARIO, STEP, BEFORE_CLASS,
         BEFORE_GROUPS, BEFORE_METHOD, BEFORE_SUITE, BEFORE_TEST, AFTER_CLASS,
         AFTER_GROUPS, AFTER_METHOD, AFTER_SUITE, AFTER_TEST)
         Types taken from report_portal/service.py
-        Mark item as started
+        Mark item as started; a retry is reported as a new attempt of the item with the same name under the parent
         """
-        return self.rp_async_service.start_test_item(name=name,
-                                                     description=description,
-                                                     attributes=attributes,
-                                                     tags=tags,
-                                                     start_time=start_time,
-                                                     item_type=item_type,
-                                                     parent_item_id=parent_item_id)
+        return self._call('start_item',
+                          self.backend.start_item,
+                          name=name,
+                          description=description,
+                          attributes=attributes,
+                          start_time=start_time,
+                          item_type=item_type,
+                          parent_item_id=parent_item_id,
+                          retry=retry)
 
-    def _finish_test(self, end_time, status, item_id, issue=None):
+    def _finish_test(self, end_time, status, item_id, issue=None, attributes=None):
         """
         Mark item as completed and set the status accordingly
         :param end_time: the end time of the execution
         :param status: the status
         :param item_id: the id of the execution to mark as complete
         :param issue: associate existing issue with the failure
+        :param attributes: the attributes added to the item
         :return: the response of the
         """
-        return self.rp_async_service.finish_test_item(end_time=end_time,
-                                               status=status,
-                                               issue=issue,
-                                               item_id=item_id)
+        return self._call('finish_item',
+                          self.backend.finish_item,
+                          end_time=end_time,
+                          status=status,
+                          issue=issue,
+                          attributes=attributes,
+                          item_id=item_id)
+
+    def _send_log_batch(self, entries):
+        try:
+            return self._call('log_batch', self.backend.log_batch, entries)
+        except Exception:
+            reportportal_error_handler(sys.exc_info(), self.metrics)
+            return self._log_inline(entries)
+
+    def _log_inline(self, entries):
+        """
+        Send again the logs of a failed request that had attachments, without them. The messages keep a preview of
+        the attached content, and a reporting error must never fail the step being logged.
+        :param entries: the log entries of the failed request
+        :return: the response of the batch request, None if there was nothing to send again or it failed too
+        """
+        if not any(entry.get('attachment') for entry in entries):
+            return None
+        inline = []
+        for entry in entries:
+            entry = dict(entry)
+            attachment = entry.pop('attachment', None)
+            if attachment:
+                entry['message'] = f"{entry['message']}\n... {attachment.get('name')} could not be attached"
+            inline.append(entry)
+        try:
+            return self._call('log_batch', self.backend.log_batch, inline)
+        except Exception:
+            reportportal_error_handler(sys.exc_info(), self.metrics)
+            return None
+
+    def _call(self, call_type, method, *args, **kwargs):
+        """
+        Call the ReportPortal client, recording the time spent and the errors when metrics are enabled
+        """
+        if self.metrics is None:
+            return method(*args, **kwargs)
+        started = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            self.metrics.increment('errors')
+            raise
+        finally:
+            if not self.backend.concurrent:
+                # A concurrent backend only queues the request here, it records how long the request took itself
+                self.metrics.record(f"rp.{call_type}", perf_counter() - started)
+
+
+class NullIntegrationService:
+    """
+    Stands in for the IntegrationService when the reporting is disabled, every call is a no-op
+    """
+
+    def _noop(self, *args, **kwargs):
+        return None
 
+    start_launcher = rerun_launcher = join_launcher = _noop
+    start_feature_test = start_scenario_test = start_step_test = report_skipped_scenarios = _noop
+    finish_step_test = finish_scenario_test = finish_feature = finish_launcher = _noop
+    log_step_result = log_batch = flush_logs = drain = terminate_service = _noop
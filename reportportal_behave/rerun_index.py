@@ -0,0 +1,47 @@
+import json
+import os
+
+
+class RerunIndex:
+    """
+    Maps features and scenarios, identified by file, line and name, to the ids of the items created for them,
+    so that a rerun can report its retries under the items of the original launch
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.launch_id = None
+        self.items = {}
+        if os.path.exists(path):
+            with open(path) as index_file:
+                index = json.load(index_file)
+            self.launch_id = index.get('launch_id')
+            self.items = index.get('items', {})
+
+    @staticmethod
+    def key(model):
+        """
+        :param model: a behave feature or scenario
+        :return: the identity of the feature or scenario, stable between runs
+        """
+        return f"{model.filename}:{model.line}:{model.name}"
+
+    def get(self, model):
+        return self.items.get(self.key(model))
+
+    def record(self, model, item_id):
+        self.items[self.key(model)] = item_id
+
+    def save(self, resolve_id=None):
+        """
+        Write the index
+        :param resolve_id: callable translating placeholder ids to the ids returned by ReportPortal
+        :return: None
+        """
+        items = self.items
+        if resolve_id is not None:
+            items = {key: resolve_id(item_id) for key, item_id in items.items()}
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as index_file:
+            json.dump({'launch_id': self.launch_id, 'items': items}, index_file)
+        os.replace(temp_path, self.path)
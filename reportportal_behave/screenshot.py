@@ -0,0 +1,104 @@
+import hashlib
+import io
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from mss import mss
+from mss.tools import to_png
+
+from reportportal_behave.reportportal_service import reportportal_error_handler
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+
+class ScreenshotService:
+    """
+    Grabs the screen into memory and encodes the image on a worker thread.
+    Downscaling and JPEG recompression of images over the size limit require Pillow;
+    without it oversized screenshots are dropped.
+    """
+
+    def __init__(self, max_size=5 * 1024 * 1024, max_width=None, jpeg_quality=70, monitor=1, metrics=None):
+        """
+        :param max_size: the maximum size in bytes of an uploaded screenshot
+        :param max_width: downscale screenshots wider than this many pixels, requires Pillow
+        :param jpeg_quality: the quality used when a screenshot has to be recompressed to fit max_size
+        :param monitor: the number of the monitor to grab, as numbered by mss; 0 grabs all the monitors together
+        :param metrics: the ClientMetrics counting the screenshots that could not be sent
+        """
+        self.max_size = max_size
+        self.monitor = monitor
+        self.metrics = metrics
+        self.max_width = max_width
+        self.jpeg_quality = jpeg_quality
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rp-screenshot')
+        self._pending = []
+        self._last_digest = None
+
+    def capture(self, name, send):
+        """
+        Grab the screen now and hand the encoded attachment to send once it is ready.
+        send is called on the worker thread with None if the screenshot is identical to the previous one
+        or could not be made to fit the size limit
+        :param name: the name of the attachment, without extension
+        :param send: callable receiving the attachment dict
+        :return: None
+        """
+        with mss() as sct:
+            shot = sct.grab(sct.monitors[self.monitor])
+        self._pending = [future for future in self._pending if not future.done()]
+        self._pending.append(self._executor.submit(self._process, name, shot, send))
+
+    def flush(self):
+        """
+        Wait until every captured screenshot was handed over
+        :return: None
+        """
+        wait(self._pending)
+        self._pending = []
+
+    def shutdown(self):
+        self.flush()
+        self._executor.shutdown()
+
+    def _process(self, name, shot, send):
+        try:
+            send(self._encode(name, shot))
+        except Exception:
+            reportportal_error_handler(sys.exc_info(), self.metrics)
+
+    def _encode(self, name, shot):
+        digest = hashlib.sha1(shot.raw).digest()
+        if digest == self._last_digest:
+            logger.debug("Screenshot %s is identical to the previous one, not uploading it again", name)
+            return None
+        self._last_digest = digest
+
+        if Image is None:
+            data = to_png(shot.rgb, shot.size)
+            mime, extension = 'image/png', 'png'
+        else:
+            image = Image.frombytes('RGB', shot.size, shot.rgb)
+            if self.max_width and image.width > self.max_width:
+                image = image.resize((self.max_width, image.height * self.max_width // image.width))
+            data, mime, extension = _save(image, 'PNG'), 'image/png', 'png'
+            if len(data) > self.max_size:
+                data, mime, extension = _save(image, 'JPEG', quality=self.jpeg_quality), 'image/jpeg', 'jpg'
+
+        if len(data) > self.max_size:
+            logger.warning("Screenshot %s is %s bytes, over the %s bytes limit, not uploading it",
+                           name, len(data), self.max_size)
+            return None
+        return {'name': f"{name}.{extension}", 'data': data, 'mime': mime}
+
+
+def _save(image, image_format, **kwargs):
+    with io.BytesIO() as buffer:
+        image.save(buffer, format=image_format, optimize=True, **kwargs)
+        return buffer.getvalue()
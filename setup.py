@@ -28,5 +28,12 @@ setup(
         "Operating System :: OS Independent",
     ],
     url="https://github.com/Adrian-Tamas/reportportal-behave-integration-client-lib",
-    install_requires=requirements
+    install_requires=requirements,
+    entry_points={
+        'console_scripts': [
+            'rp-behave-replay=reportportal_behave.replay:main',
+            'rp-behave-import=reportportal_behave.json_import:main',
+            'rp-behave-agent=reportportal_behave.agent:main',
+        ]
+    }
 )